@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# benchmark.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Time every stage from loading an image to exporting its ASCII art.
+
+Runs without a display. Results are written as JSON, and compared
+against a baseline from an earlier run if one is given.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+FORMATS = ["jpeg", "png", "webp", "gif"]
+MEGAPIXELS = [1, 4, 12]
+WIDTHS = [50, 100, 200, 1000]
+
+QUICK_MEGAPIXELS = [0.25]
+QUICK_WIDTHS = [100]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--source-dir",
+        default=os.path.join(os.path.dirname(__file__), "..", "src"),
+        help="directory containing Letterpress's Python sources",
+    )
+    parser.add_argument("-o", "--output", help="file to write the results to")
+    parser.add_argument("--baseline", help="results of an earlier run to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown that counts as a regression (default: 0.2)",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage")
+    parser.add_argument(
+        "--quick", action="store_true", help="only check that every stage runs"
+    )
+    args = parser.parse_args()
+
+    load_package(args.source_dir)
+    megapixels, widths = (
+        (QUICK_MEGAPIXELS, QUICK_WIDTHS) if args.quick else (MEGAPIXELS, WIDTHS)
+    )
+    repeat = 1 if args.quick else args.repeat
+
+    results = {}
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        for path in generate_corpus(corpus_dir, megapixels):
+            name = os.path.splitext(os.path.basename(path))[0]
+            benchmark_image(path, name, widths, repeat, results)
+        benchmark_texture(megapixels, repeat, results)
+
+    report = {"version": 1, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+    for stage, timing in sorted(results.items()):
+        print(f"{stage:<48} {timing['median'] * 1000:10.2f} ms")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        return compare(results, baseline, args.threshold)
+    return 0
+
+
+def load_package(source_dir):
+    """Import the sources as the `letterpress` package, as installed."""
+    spec = importlib.util.spec_from_file_location(
+        "letterpress",
+        os.path.join(source_dir, "__init__.py"),
+        submodule_search_locations=[source_dir],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["letterpress"] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+def generate_corpus(directory, megapixels):
+    """Write one image per format and size, with both gradients and noise."""
+    rng = np.random.default_rng(0)
+    for size in megapixels:
+        width = int((size * 1_000_000 * 3 / 2) ** 0.5)
+        height = width * 2 // 3
+
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        noise = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+        pixels = np.dstack((x + 0 * y, y + 0 * x, (x + y) / 2)).astype(np.uint8)
+        img = Image.fromarray(pixels // 4 * 3 + noise)
+
+        for file_format in FORMATS:
+            path = os.path.join(directory, f"{file_format}-{size}mp.{file_format}")
+            img.save(path, format=file_format)
+            yield path
+
+
+def measure(results, stage, function, repeat):
+    timings = []
+    for _run in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        timings.append(time.perf_counter() - start)
+
+    results[stage] = {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "runs": repeat,
+    }
+    return value
+
+
+def benchmark_image(path, name, widths, repeat, results):
+    from letterpress import export, image_identity, image_loader, renderer
+
+    def decode():
+        with Image.open(path) as img:
+            img.load()
+            return img
+
+    decoded = measure(results, f"{name}/decode", decode, repeat)
+    shrunken = measure(
+        results,
+        f"{name}/cover",
+        lambda: ImageOps.cover(decoded, image_loader.PREVIEW_SIZE),
+        repeat,
+    )
+    measure(
+        results,
+        f"{name}/exif_transpose",
+        lambda: ImageOps.exif_transpose(shrunken),
+        repeat,
+    )
+    image = measure(
+        results,
+        f"{name}/load",
+        lambda: image_loader.load(path, width=max(widths)),
+        repeat,
+    )
+    measure(
+        results,
+        f"{name}/identity",
+        lambda: (
+            image_identity.file_digest(path),
+            image_identity.perceptual_hash(image),
+        ),
+        repeat,
+    )
+
+    for width in widths:
+        rendering = measure(
+            results,
+            f"{name}/convert/{width}",
+            lambda: renderer.convert(image, width),
+            repeat,
+        )
+        for invert in (False, True):
+            measure(
+                results,
+                f"{name}/text/{width}/{'inverted' if invert else 'plain'}",
+                lambda: rendering.to_text(invert),
+                repeat,
+            )
+        for file_format in export.FORMATS:
+            measure(
+                results,
+                f"{name}/export/{width}/{file_format}",
+                lambda: sum(
+                    len(chunk) for chunk in export.chunks(rendering, file_format)
+                ),
+                repeat,
+            )
+
+
+def benchmark_texture(megapixels, repeat, results):
+    """Time texture ingestion, if GTK is available."""
+    try:
+        import gi
+
+        gi.require_version("Gdk", "4.0")
+        from gi.repository import Gdk, GLib
+
+        from letterpress import image_loader, texture_to_file
+    except (ImportError, ValueError) as error:
+        print(f"Skipping texture ingestion: {error}")
+        return
+
+    for size in megapixels:
+        width = int((size * 1_000_000 * 3 / 2) ** 0.5)
+        height = width * 2 // 3
+        pixels = np.random.default_rng(0).integers(0, 256, (height, width, 4), np.uint8)
+        texture = Gdk.MemoryTexture.new(
+            width,
+            height,
+            Gdk.MemoryFormat.R8G8B8A8,
+            GLib.Bytes.new(pixels.tobytes()),
+            width * 4,
+        )
+        measure(
+            results,
+            f"texture-{size}mp/ingest",
+            lambda: image_loader.prepare(texture_to_file.to_image(texture)),
+            repeat,
+        )
+
+
+def compare(results, baseline, threshold):
+    """Print how every stage changed, returning 1 if any regressed."""
+    regressions = 0
+    for stage, timing in sorted(results.items()):
+        if stage not in baseline:
+            continue
+
+        ratio = timing["median"] / baseline[stage]["median"]
+        regressed = ratio > 1 + threshold
+        regressions += regressed
+        print(f"{stage:<48} {ratio:6.2f}× {'REGRESSION' if regressed else ''}")
+
+    print(f"{regressions} regressions above {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# animation.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+from collections import deque
+
+import numpy as np
+from PIL import ImageSequence
+
+from . import image_loader, renderer
+
+# Frames without a duration are shown this long, in milliseconds
+DEFAULT_DURATION = 100
+
+# Browsers show frames that are quicker than this at the default duration
+MIN_DURATION = 20
+
+# Frames are no longer added once they take this many bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class Animation:
+    """A sequence of ASCII art frames, stored as row deltas.
+
+    Each frame only keeps the rows that differ from the previous frame,
+    so static backgrounds cost nothing after the first frame. Frames are
+    appended while the rest of the animation is still being converted,
+    until they take `max_size` bytes. Longer animations are cut short.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.__frames = []
+        self.__last = None
+        self.__max_size = max_size
+        self.size = 0
+        self.finished = False
+
+    def __len__(self):
+        return len(self.__frames)
+
+    def append(self, rendering, duration):
+        """Add a frame, returning False if it doesn't fit anymore.
+
+        The animation is finished once a frame doesn't fit, and ends
+        with the frames added before it. The first frame always fits.
+        """
+        changed = None
+        if self.__last is not None:
+            changed = renderer.changed_rows(self.__last, rendering)
+        full = changed is None
+        if full:
+            changed = np.arange(rendering.rows)
+
+        colors = None if rendering.colors is None else rendering.colors[changed]
+        rows = renderer.Rendering(rendering.levels[changed], colors)
+        frame_size = sys.getsizeof(rows) + changed.nbytes
+        if self.__frames and self.size + frame_size > self.__max_size:
+            self.finished = True
+            return False
+
+        self.__frames.append((full, changed, rows, duration))
+        self.size += frame_size
+        self.__last = rendering
+        return True
+
+    def changes(self, index):
+        """Return the rows frame `index` changes, their contents and duration.
+
+        The first frame changes every row.
+        """
+        _full, changed, rows, duration = self.__frames[index]
+        return changed, rows, duration
+
+    def __iter__(self):
+        """Yield every frame as a full Rendering, with its duration."""
+        levels = colors = None
+        for full, changed, rows, duration in self.__frames:
+            if full:
+                levels = rows.levels.copy()
+                colors = None if rows.colors is None else rows.colors.copy()
+            else:
+                levels[changed] = rows.levels
+                if colors is not None:
+                    colors[changed] = rows.colors
+            yield renderer.Rendering(
+                levels.copy(), None if colors is None else colors.copy()
+            ), duration
+
+
+def is_animated(filepath):
+    with image_loader.open_image(filepath) as img:
+        return getattr(img, "is_animated", False)
+
+
+def frames(filepath, max_memory=image_loader.DEFAULT_MAX_MEMORY, width=0):
+    """Decode and prepare the frames of an animated image one by one."""
+    with image_loader.open_image(filepath) as img:
+        decoded_size = img.width * img.height * 4
+        if decoded_size > max_memory:
+            raise image_loader.ImageTooLargeError(
+                f"Decoding {img.width}×{img.height} pixel frames needs "
+                f"{decoded_size} bytes"
+            )
+
+        for frame in ImageSequence.Iterator(img):
+            duration = frame.info.get("duration") or DEFAULT_DURATION
+            if duration < MIN_DURATION:
+                duration = DEFAULT_DURATION
+            yield image_loader.prepare(frame.convert("RGB"), width), int(duration)
+
+
+def convert_frames(filepath, width, backend, executor, max_memory, cancellable):
+    """Convert the frames of an animated image on a process pool.
+
+    Yields a Rendering and a duration per frame, in order. Only a few
+    frames are decoded ahead of the one being yielded, so memory stays
+    bounded however long the animation is.
+    """
+    in_flight = deque()
+    max_in_flight = 2 * (os.cpu_count() or 1)
+
+    for image, duration in frames(filepath, max_memory, width):
+        if cancellable.is_cancelled():
+            break
+
+        in_flight.append(
+            (executor.submit(renderer.convert, image, width, backend), duration)
+        )
+        if len(in_flight) >= max_in_flight:
+            future, duration = in_flight.popleft()
+            yield future.result(), duration
+
+    while in_flight and not cancellable.is_cancelled():
+        future, duration = in_flight.popleft()
+        yield future.result(), duration
+
+    for future, _duration in in_flight:
+        future.cancel()
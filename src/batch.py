@@ -0,0 +1,207 @@
+# batch.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import argparse
+import glob
+import os
+from concurrent.futures import Future, as_completed
+
+from . import (
+    disk_cache,
+    image_identity,
+    image_loader,
+    process_pool,
+    renderer,
+    supported_formats,
+)
+
+# The render cache of this process, see `_get_cache`
+_cache = None
+
+
+def main(arguments):
+    """Convert images to text files without opening a window.
+
+    Returns the exit status: 0 if every image was converted, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(
+        prog="letterpress --batch",
+        description="Convert images to ASCII art text files.",
+    )
+    parser.add_argument("--batch", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--width", type=int, default=100, help="output width in characters"
+    )
+    parser.add_argument(
+        "--invert", action="store_true", help="use dense glyphs for dark areas"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(), help="number of worker processes"
+    )
+    parser.add_argument(
+        "--backend", choices=renderer.BACKENDS, default=renderer.BACKENDS[0]
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="don't look up or store conversions in the render cache",
+    )
+    parser.add_argument(
+        "-o", "--output", default=".", help="directory to write text files to"
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="image files, directories or glob patterns"
+    )
+    args = parser.parse_args(arguments)
+
+    if args.width < 1 or args.jobs < 1:
+        parser.error("--width and --jobs must be positive")
+
+    os.makedirs(args.output, exist_ok=True)
+    jobs = output_paths(collect_inputs(args.inputs), args.output)
+    if not jobs:
+        parser.error("no supported images found")
+
+    failed = 0
+    single = len(jobs) == 1
+    with process_pool.new(
+        args.jobs if single else min(args.jobs, len(jobs))
+    ) as executor:
+        # A single image is converted here, split into bands across the pool
+        submit = _run_here if single else executor.submit
+
+        futures = {
+            submit(
+                convert_file,
+                path,
+                output_path,
+                args.width,
+                args.invert,
+                args.backend,
+                args.cache,
+                executor if single else None,
+            ): path
+            for path, output_path in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                print(f"ok\t{futures[future]}\t{future.result()}", flush=True)
+            except Exception as error:
+                failed += 1
+                print(f"failed\t{futures[future]}\t{error}", flush=True)
+
+    print(f"{len(jobs) - failed} converted, {failed} failed")
+    return 1 if failed else 0
+
+
+def collect_inputs(inputs):
+    """Expand directories and glob patterns into a list of image paths."""
+    extensions = tuple(f".{extension}" for extension in _extensions())
+
+    paths = []
+    for pattern in inputs:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else []
+        for path in matches or [pattern]:
+            if not os.path.isdir(path):
+                paths.append(path)
+                continue
+
+            for directory, _subdirs, files in os.walk(path):
+                paths.extend(
+                    os.path.join(directory, file)
+                    for file in sorted(files)
+                    if file.lower().endswith(extensions)
+                )
+
+    # Keep the first occurrence of files matched more than once
+    return list(dict.fromkeys(paths))
+
+
+def output_paths(paths, output_dir):
+    """Pair every input with a distinct text file in `output_dir`."""
+    used_names = set()
+    jobs = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, counter = f"{stem}.txt", 1
+        while name in used_names:
+            counter += 1
+            name = f"{stem}-{counter}.txt"
+
+        used_names.add(name)
+        jobs.append((path, os.path.join(output_dir, name)))
+    return jobs
+
+
+def convert_file(path, output_path, width, invert, backend, cache=True, executor=None):
+    """Convert one image and write it to `output_path`.
+
+    Runs in a worker process, unless large images are to be rendered in
+    bands on the process pool `executor`. With `cache`, images converted
+    before at the same width, by any Letterpress instance, are not
+    decoded again.
+    """
+    rendering = None
+    if cache:
+        renderings = _get_cache()
+        key = (image_identity.file_digest(path), width, backend)
+        rendering = renderings.get(key)
+
+    if rendering is None:
+        rendering = renderer.convert(
+            image_loader.load(path, width=width), width, backend, executor
+        )
+        if cache:
+            renderings.put(key, rendering)
+
+    output = rendering.to_text(invert)
+
+    with open(output_path, "w", encoding="utf-8") as file:
+        file.write(output)
+    return output_path
+
+
+def _get_cache():
+    """Return the render cache shared by the jobs run in this process.
+
+    Batch conversions don't know the cache size set in the preferences,
+    so they never evict entries. The application trims the cache to
+    its size when it next stores a conversion.
+    """
+    global _cache
+
+    if _cache is None:
+        _cache = disk_cache.DiskCache(disk_cache.default_directory(), max_size=None)
+    return _cache
+
+
+def _run_here(function, *args):
+    """Run a job in this process, returning a future like a pool would."""
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def _extensions():
+    yield from supported_formats.formats
+    yield "jpg"
@@ -0,0 +1,263 @@
+# conversion_worker.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from gi.repository import Gio, GLib
+
+
+class ConversionScheduler:
+    """Run the jobs of several owners, such as windows, on one pool of threads.
+
+    Jobs of the foreground owner run first, and the other owners take
+    turns, so that one busy window can't starve the rest. Even the
+    foreground owner yields a turn after FOREGROUND_TURNS jobs in a row.
+    Speculative jobs run on a separate, low priority thread. Threads are
+    only started once the first job is submitted.
+    """
+
+    FOREGROUND_TURNS = 3
+
+    def __init__(self, max_workers=None):
+        self.__queues = OrderedDict()
+        self.__foreground = None
+        self.__foreground_turns = 0
+        self.__condition = threading.Condition()
+        self.__max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.__started = False
+        self.__prefetch_executor = None
+
+    def submit(self, owner, function, *args, urgent=False):
+        """Queue `function(*args)` on behalf of `owner`, returning a Future.
+
+        An `urgent` job, such as one the user is waiting for, runs before
+        the other jobs of the same owner.
+        """
+        future = Future()
+        with self.__condition:
+            if not self.__started:
+                self.__start()
+            queue = self.__queues.setdefault(owner, deque())
+            if urgent:
+                queue.appendleft((future, function, args))
+            else:
+                queue.append((future, function, args))
+            self.__condition.notify()
+        return future
+
+    def prefetch(self, function, *args):
+        if self.__prefetch_executor is None:
+            self.__prefetch_executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="letterpress-prefetch",
+                initializer=self.__lower_thread_priority,
+            )
+        return self.__prefetch_executor.submit(function, *args)
+
+    def set_foreground(self, owner):
+        with self.__condition:
+            self.__foreground = owner
+
+    def forget(self, owner):
+        """Cancel the queued jobs of `owner`, which is going away."""
+        with self.__condition:
+            for future, _function, _args in self.__queues.pop(owner, ()):
+                future.cancel()
+            if self.__foreground is owner:
+                self.__foreground = None
+
+    def __start(self):
+        self.__started = True
+        for index in range(self.__max_workers):
+            threading.Thread(
+                target=self.__work,
+                name=f"letterpress-conversion-{index}",
+                daemon=True,
+            ).start()
+
+    def __next_job(self):
+        owner = self.__foreground
+        if owner in self.__queues and (
+            self.__foreground_turns < self.FOREGROUND_TURNS or len(self.__queues) == 1
+        ):
+            self.__foreground_turns += 1
+        else:
+            owner = next(
+                other for other in self.__queues if other is not self.__foreground
+            )
+            self.__foreground_turns = 0
+
+        queue = self.__queues[owner]
+        job = queue.popleft()
+        if queue:
+            # Let the other owners go first next time
+            self.__queues.move_to_end(owner)
+        else:
+            del self.__queues[owner]
+        return job
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__queues)
+                future, function, args = self.__next_job()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except Exception as error:
+                future.set_exception(error)
+
+    @staticmethod
+    def __lower_thread_priority():
+        # On Linux, niceness is a per-thread attribute
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+
+class ConversionWorker:
+    """Run conversions off the main loop, keeping only the newest result.
+
+    Submitting a job cancels the previous one: if it has not started yet
+    it never will, and if it is running its result is dropped. Callbacks
+    are always invoked on the main loop.
+
+    Jobs run on a ConversionScheduler shared with other workers, on
+    behalf of `owner`. Speculative jobs are all cancelled as soon as a
+    regular job is submitted.
+    """
+
+    # How long `submit_later` waits for requests to stop, in milliseconds
+    SETTLE_DELAY = 150
+
+    def __init__(self, scheduler, owner):
+        self.__scheduler = scheduler
+        self.__owner = owner
+        self.__cancellable = None
+        self.__future = None
+        self.__prefetches = []
+        self.__pending = None
+
+    def submit(self, job, callback, error_callback, *args):
+        """Run `job(cancellable, *args)` on a conversion thread.
+
+        Jobs should check the cancellable between expensive steps.
+        """
+        self.cancel()
+        self.cancel_prefetches()
+
+        cancellable = Gio.Cancellable()
+        self.__cancellable = cancellable
+        self.__future = self.__scheduler.submit(
+            self.__owner,
+            self.__run,
+            cancellable,
+            job,
+            callback,
+            error_callback,
+            args,
+            urgent=True,
+        )
+
+    def submit_later(self, job, callback, error_callback, *args):
+        """Like `submit`, once no other job was submitted for a moment.
+
+        Every call replaces the job still waiting, so a burst of requests
+        only runs the last one. The running job is cancelled right away.
+        """
+        self.cancel()
+        self.cancel_prefetches()
+        self.__pending = GLib.timeout_add(
+            self.SETTLE_DELAY,
+            self.__submit_pending,
+            job,
+            callback,
+            error_callback,
+            args,
+        )
+
+    def __submit_pending(self, job, callback, error_callback, args):
+        self.__pending = None
+        self.submit(job, callback, error_callback, *args)
+        return GLib.SOURCE_REMOVE
+
+    def prefetch(self, job, callback, *args):
+        """Run `job(cancellable, *args)` speculatively at low priority.
+
+        Failures are ignored, since nobody is waiting for the result.
+        """
+        cancellable = Gio.Cancellable()
+        future = self.__scheduler.prefetch(
+            self.__run, cancellable, job, callback, lambda error: None, args
+        )
+        self.__prefetches.append((cancellable, future))
+        future.add_done_callback(
+            lambda future: GLib.idle_add(self.__forget_prefetch, cancellable, future)
+        )
+
+    def is_busy(self):
+        """Whether a job was submitted whose result is yet to be delivered."""
+        return self.__pending is not None or self.__cancellable is not None
+
+    def cancel(self):
+        if self.__pending is not None:
+            GLib.source_remove(self.__pending)
+            self.__pending = None
+        if self.__cancellable is not None:
+            self.__cancellable.cancel()
+            self.__future.cancel()
+            self.__cancellable = self.__future = None
+
+    def cancel_prefetches(self):
+        for cancellable, future in self.__prefetches:
+            cancellable.cancel()
+            future.cancel()
+        self.__prefetches.clear()
+
+    def __forget_prefetch(self, cancellable, future):
+        try:
+            self.__prefetches.remove((cancellable, future))
+        except ValueError:
+            pass
+        return GLib.SOURCE_REMOVE
+
+    def __run(self, cancellable, job, callback, error_callback, args):
+        if cancellable.is_cancelled():
+            return
+
+        try:
+            result = job(cancellable, *args)
+        except Exception as error:
+            GLib.idle_add(self.__deliver, cancellable, error_callback, error)
+        else:
+            GLib.idle_add(self.__deliver, cancellable, callback, result)
+
+    def __deliver(self, cancellable, callback, value):
+        if cancellable is self.__cancellable:
+            self.__cancellable = self.__future = None
+        # Cancelling happens on the main loop too, so this check can't race
+        if not cancellable.is_cancelled():
+            callback(value)
+        return GLib.SOURCE_REMOVE
@@ -0,0 +1,198 @@
+# dbus_service.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+
+from gi.repository import Gio, GLib
+
+from . import image_identity, lazy_import, process_pool
+
+export = lazy_import.module(".export", __package__)
+image_loader = lazy_import.module(".image_loader", __package__)
+renderer = lazy_import.module(".renderer", __package__)
+
+INTERFACE_NAME = "io.gitlab.gregorni.Letterpress.Converter"
+
+INTERFACE_XML = f"""
+<node>
+  <interface name="{INTERFACE_NAME}">
+    <method name="Convert">
+      <arg name="path" type="s" direction="in"/>
+      <arg name="width" type="u" direction="in"/>
+      <arg name="invert" type="b" direction="in"/>
+      <arg name="text" type="s" direction="out"/>
+    </method>
+    <method name="ConvertToFd">
+      <arg name="path" type="s" direction="in"/>
+      <arg name="width" type="u" direction="in"/>
+      <arg name="invert" type="b" direction="in"/>
+      <arg name="format" type="s" direction="in"/>
+      <arg name="fd" type="h" direction="in"/>
+      <arg name="size" type="t" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+
+ERROR_PREFIX = "io.gitlab.gregorni.Letterpress.Error"
+
+
+class ConversionService:
+    """Convert images for other programs over D-Bus.
+
+    Calls are converted on the application's shared threads, after the
+    jobs of the foreground window, and share its caches. `Convert`
+    returns the text, while `ConvertToFd` writes it to a file descriptor
+    passed by the caller, which suits large outputs better than a D-Bus
+    message.
+
+    `on_busy` is called with True when a call starts and with False when
+    it is answered, so the application can stay alive meanwhile.
+    """
+
+    def __init__(self, settings, shared_state, on_busy):
+        self.__settings = settings
+        self.__shared_state = shared_state
+        self.__on_busy = on_busy
+        self.__registration_ids = {}
+
+    def register(self, connection, object_path):
+        node_info = Gio.DBusNodeInfo.new_for_xml(INTERFACE_XML)
+        self.__registration_ids[connection] = connection.register_object(
+            f"{object_path}/Converter",
+            node_info.interfaces[0],
+            self.__on_method_call,
+            None,
+            None,
+        )
+
+    def unregister(self, connection):
+        registration_id = self.__registration_ids.pop(connection, None)
+        if registration_id is not None:
+            connection.unregister_object(registration_id)
+
+    def __on_method_call(
+        self,
+        connection,
+        sender,
+        object_path,
+        interface_name,
+        method_name,
+        parameters,
+        invocation,
+    ):
+        # Import the conversion pipeline on the main thread
+        self.__shared_state.prewarm()
+
+        path, width, invert, *fd_args = parameters.unpack()
+        # The service's working directory is unrelated to the caller's
+        if not os.path.isabs(path):
+            invocation.return_dbus_error(
+                "org.freedesktop.DBus.Error.InvalidArgs", "The path must be absolute"
+            )
+            return
+        if not 1 <= width <= renderer.MAX_WIDTH:
+            invocation.return_dbus_error(
+                "org.freedesktop.DBus.Error.InvalidArgs",
+                f"The width must be between 1 and {renderer.MAX_WIDTH}",
+            )
+            return
+
+        output = file_format = None
+        if method_name == "ConvertToFd":
+            file_format, fd_index = fd_args
+            if file_format not in export.FORMATS:
+                invocation.return_dbus_error(
+                    "org.freedesktop.DBus.Error.InvalidArgs",
+                    f"The format must be one of {', '.join(export.FORMATS)}",
+                )
+                return
+
+            fd_list = invocation.get_message().get_unix_fd_list()
+            if fd_list is None or not 0 <= fd_index < fd_list.get_length():
+                invocation.return_dbus_error(
+                    "org.freedesktop.DBus.Error.InvalidArgs",
+                    "No file descriptor passed",
+                )
+                return
+            output = open(fd_list.get(fd_index), "wb")
+
+        self.__on_busy(True)
+        self.__shared_state.scheduler.submit(
+            self,
+            self.__run,
+            invocation,
+            path,
+            width,
+            invert,
+            self.__settings["conversion-backend"],
+            self.__shared_state.get_max_memory(),
+            output,
+            file_format,
+        )
+
+    def __run(
+        self, invocation, path, width, invert, backend, max_memory, output, file_format
+    ):
+        """Answer a call, on a conversion thread.
+
+        Returns the text, or writes it to `output` if given.
+        """
+        try:
+            rendering = self.__convert(path, width, backend, max_memory)
+            if output is None:
+                result = GLib.Variant("(s)", (rendering.to_text(invert),))
+            else:
+                size = 0
+                with output:
+                    for chunk in export.chunks(rendering, file_format, invert):
+                        output.write(chunk)
+                        size += len(chunk)
+                result = GLib.Variant("(t)", (size,))
+        except image_loader.ImageTooLargeError as error:
+            invocation.return_dbus_error(f"{ERROR_PREFIX}.TooLarge", str(error))
+        except IOError as error:
+            invocation.return_dbus_error(f"{ERROR_PREFIX}.UnsupportedImage", str(error))
+        except Exception as error:
+            invocation.return_dbus_error(f"{ERROR_PREFIX}.Failed", str(error))
+        else:
+            invocation.return_value(result)
+        finally:
+            if output is not None:
+                output.close()
+            GLib.idle_add(self.__on_busy, False)
+
+    def __convert(self, path, width, backend, max_memory):
+        key = (image_identity.file_digest(path), width, backend)
+        render_cache = self.__shared_state.render_cache
+        rendering = render_cache.get(key)
+        if rendering is not None:
+            return rendering
+
+        disk_cache = self.__shared_state.disk_cache
+        rendering = disk_cache.get(key)
+        if rendering is None:
+            image = image_loader.load(path, max_memory, width)
+            rendering = renderer.convert(
+                image, width, backend, process_pool.get_default()
+            )
+            disk_cache.put(key, rendering)
+
+        render_cache.put(key, rendering)
+        return rendering
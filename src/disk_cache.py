@@ -0,0 +1,209 @@
+# disk_cache.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from . import renderer
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Bytes of the index mapped into memory by every connection
+MMAP_SIZE = 64 * 1024 * 1024
+
+# How long to wait for another instance holding the write lock, in seconds
+TIMEOUT = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS renderings (
+    digest TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    backend TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    columns INTEGER NOT NULL,
+    levels BLOB NOT NULL,
+    colors BLOB,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (digest, width, backend, version)
+);
+CREATE INDEX IF NOT EXISTS renderings_accessed ON renderings (accessed);
+"""
+
+
+def default_directory():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "letterpress")
+
+
+class DiskCache:
+    """Keep renderings across sessions, evicting the least recently used ones.
+
+    Entries are keyed by (image digest, width, backend) and stored as
+    compressed level and color grids, so one entry serves both color
+    schemes. The index is an SQLite database in WAL mode, which lets
+    several instances and batch workers read and write it at once.
+    Failing to use the cache is never an error: lookups just miss.
+
+    A `max_size` of None never evicts anything, leaving that to the
+    instances that know the configured size.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.__path = os.path.join(directory, "renderings.sqlite3")
+        self.__max_size = max_size
+        # Connections can't be shared between threads
+        self.__local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if self.__is_disabled():
+            return None
+
+        digest, width, backend = key
+        try:
+            connection = self.__connect()
+            row = connection.execute(
+                "SELECT rows, columns, levels, colors FROM renderings "
+                "WHERE digest = ? AND width = ? AND backend = ? AND version = ?",
+                (digest, width, backend, renderer.RENDERER_VERSION),
+            ).fetchone()
+            if row is not None:
+                with connection:
+                    connection.execute(
+                        "UPDATE renderings SET accessed = ? "
+                        "WHERE digest = ? AND width = ? AND backend = ? "
+                        "AND version = ?",
+                        (
+                            time.time(),
+                            digest,
+                            width,
+                            backend,
+                            renderer.RENDERER_VERSION,
+                        ),
+                    )
+        except (sqlite3.Error, OSError) as error:
+            print(f"Unable to read the render cache: {error}")
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        rows, columns, levels, colors = row
+        return renderer.Rendering(
+            _decompress(levels, (rows, columns)),
+            None if colors is None else _decompress(colors, (rows, columns, 3)),
+        )
+
+    def put(self, key, rendering):
+        if self.__is_disabled():
+            return
+
+        digest, width, backend = key
+        levels = zlib.compress(np.ascontiguousarray(rendering.levels).tobytes())
+        colors = None
+        if rendering.colors is not None:
+            colors = zlib.compress(np.ascontiguousarray(rendering.colors).tobytes())
+        size = len(levels) + len(colors or b"")
+        if self.__max_size is not None and size > self.__max_size:
+            return
+
+        try:
+            connection = self.__connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO renderings VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        digest,
+                        width,
+                        backend,
+                        renderer.RENDERER_VERSION,
+                        rendering.rows,
+                        rendering.columns,
+                        levels,
+                        colors,
+                        size,
+                        time.time(),
+                    ),
+                )
+                if self.__max_size is not None:
+                    self.__evict(connection)
+        except (sqlite3.Error, OSError) as error:
+            print(f"Unable to write the render cache: {error}")
+
+    def set_max_size(self, max_size):
+        self.__max_size = max_size
+
+    def clear(self):
+        try:
+            connection = self.__connect()
+            with connection:
+                connection.execute("DELETE FROM renderings")
+            connection.execute("PRAGMA incremental_vacuum")
+        except (sqlite3.Error, OSError) as error:
+            print(f"Unable to clear the render cache: {error}")
+
+    def __is_disabled(self):
+        return self.__max_size is not None and self.__max_size <= 0
+
+    def __evict(self, connection):
+        """Delete the least recently used entries beyond the maximum size."""
+        deleted = connection.execute(
+            "DELETE FROM renderings WHERE rowid IN ("
+            "SELECT rowid FROM (SELECT rowid, SUM(size) OVER "
+            "(ORDER BY accessed DESC, rowid) AS total FROM renderings) "
+            "WHERE total > ?)",
+            (self.__max_size,),
+        ).rowcount
+        if deleted > 0:
+            connection.execute("PRAGMA incremental_vacuum")
+
+    def __connect(self):
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None:
+            return connection
+
+        os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+        connection = sqlite3.connect(self.__path, timeout=TIMEOUT)
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        with connection:
+            connection.executescript(_SCHEMA)
+
+        self.__local.connection = connection
+        return connection
+
+    def __str__(self):
+        return f"{self.__path}, {self.hits} hits, {self.misses} misses"
+
+
+def _decompress(data, shape):
+    return np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape).copy()
@@ -0,0 +1,112 @@
+# export.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import html
+
+from . import renderer
+
+# Rows are encoded and written this many at a time
+CHUNK_ROWS = 64
+
+# File extensions of the supported formats, the first being the default
+FORMATS = ["txt", "ans", "html"]
+
+
+def format_for_filename(filename):
+    extension = filename.rpartition(".")[2].lower()
+    if extension in ("htm", "html"):
+        return "html"
+    if extension in ("ans", "ansi"):
+        return "ans"
+    return "txt"
+
+
+def chunks(rendering, file_format, invert=False):
+    """Yield the rendering encoded in `file_format`, as UTF-8 chunks.
+
+    Only one chunk of rows is held in memory at a time. Colored formats
+    fall back to plain text if the rendering has no colors.
+    """
+    if file_format == "html":
+        yield from _html_chunks(rendering, invert)
+        return
+
+    colored = file_format == "ans" and rendering.colors is not None
+    for start in range(0, rendering.rows, CHUNK_ROWS):
+        stop = min(start + CHUNK_ROWS, rendering.rows)
+        rows = rendering.to_rows(invert, start, stop)
+        if colored:
+            rows = [
+                "".join(
+                    f"\x1b[38;2;{red};{green};{blue}m{text}"
+                    for text, (red, green, blue) in _color_runs(row, colors)
+                )
+                + "\x1b[0m"
+                for row, colors in zip(rows, rendering.colors[start:stop])
+            ]
+        yield "".join(f"{row}\n" for row in rows).encode("utf-8")
+
+
+def animation_chunks(frames, file_format, invert=False):
+    """Yield every frame of an Animation, as UTF-8 chunks.
+
+    ANSI files redraw every frame in place, without any delay between
+    frames, so a terminal only shows the last one unless they are
+    printed at the pace of the source. Plain text files separate frames
+    with form feeds. HTML is not supported.
+    """
+    for index, (rendering, _duration) in enumerate(frames):
+        if file_format == "ans":
+            yield ("\x1b[2J\x1b[H" if index == 0 else "\x1b[H").encode("utf-8")
+        elif index > 0:
+            yield b"\f\n"
+        yield from chunks(rendering, file_format, invert)
+
+
+def _html_chunks(rendering, invert):
+    foreground, background = ("black", "white") if invert else ("white", "black")
+    yield (
+        '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+        "<title>Letterpress</title>\n</head>\n"
+        f'<body style="background: {background}; color: {foreground}">\n<pre>'
+    ).encode("utf-8")
+
+    for start in range(0, rendering.rows, CHUNK_ROWS):
+        stop = min(start + CHUNK_ROWS, rendering.rows)
+        rows = rendering.to_rows(invert, start, stop)
+        if rendering.colors is None:
+            lines = [html.escape(row) for row in rows]
+        else:
+            lines = [
+                "".join(
+                    f'<span style="color: #{red:02x}{green:02x}{blue:02x}">'
+                    f"{html.escape(text)}</span>"
+                    for text, (red, green, blue) in _color_runs(row, colors)
+                )
+                for row, colors in zip(rows, rendering.colors[start:stop])
+            ]
+        yield "".join(f"{line}\n" for line in lines).encode("utf-8")
+
+    yield "</pre>\n</body>\n</html>\n".encode("utf-8")
+
+
+def _color_runs(row, colors):
+    """Split a row into runs of glyphs sharing the same color."""
+    for start, stop, color in renderer.color_runs(colors):
+        yield row[start:stop], color
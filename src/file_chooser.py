@@ -19,7 +19,7 @@
 
 from gi.repository import Adw, Gio, GLib, Gtk
 
-from . import supported_formats
+from . import export, supported_formats, tracing
 
 
 class FileChooser:
@@ -48,20 +48,69 @@ class FileChooser:
 
     @staticmethod
     def save_file(parent, *args):
-        def __on_save_file(file):
+        def __on_save_file(file, file_format):
             print(f"Output file: {file.get_path()}")
-            text = parent.output_label.get_label()
-            if text != None:
-                file.replace_contents_bytes_async(
-                    contents=GLib.Bytes.new(text.encode("utf-8")),
-                    etag=None,
-                    make_backup=False,
-                    flags=Gio.FileCreateFlags.NONE,
-                    cancellable=None,
-                    callback=__save_file_complete,
+            span = tracing.span("export", format=file_format)
+            frames = parent.animation
+            if frames is not None and frames.finished and file_format != "html":
+                chunks = export.animation_chunks(
+                    frames, file_format, parent.get_invert()
                 )
+            else:
+                chunks = export.chunks(
+                    parent.rendering, file_format, parent.get_invert()
+                )
+
+            def __on_replaced(file, result):
+                try:
+                    __write_next_chunk(file.replace_finish(result))
+                except GLib.GError:
+                    __on_written(False)
+
+            def __write_next_chunk(stream):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    stream.close_async(GLib.PRIORITY_DEFAULT, None, __on_closed)
+                else:
+                    stream.write_all_async(
+                        chunk, GLib.PRIORITY_DEFAULT, None, __on_chunk_written
+                    )
+
+            def __on_chunk_written(stream, result):
+                try:
+                    stream.write_all_finish(result)
+                except GLib.GError:
+                    # Closing cancelled leaves the original file untouched
+                    cancellable = Gio.Cancellable()
+                    cancellable.cancel()
+                    try:
+                        stream.close(cancellable)
+                    except GLib.GError:
+                        pass
+                    __on_written(False)
+                else:
+                    __write_next_chunk(stream)
+
+            def __on_closed(stream, result):
+                try:
+                    __on_written(stream.close_finish(result))
+                except GLib.GError:
+                    __on_written(False)
+
+            def __on_written(success):
+                span.end()
+                __save_file_complete(file, success)
 
-        def __save_file_complete(file, result):
+            file.replace_async(
+                etag=None,
+                make_backup=False,
+                flags=Gio.FileCreateFlags.NONE,
+                io_priority=GLib.PRIORITY_DEFAULT,
+                cancellable=None,
+                callback=__on_replaced,
+            )
+
+        def __save_file_complete(file, success):
             info = file.query_info(
                 "standard::display-name", Gio.FileQueryInfoFlags.NONE
             )
@@ -77,7 +126,7 @@ class FileChooser:
                     display_name=display_name
                 )
             )
-            if not file.replace_contents_finish(result):
+            if not success:
                 print(f"Unable to save {display_name}")
             else:
                 toast.set_title(
@@ -92,10 +141,36 @@ class FileChooser:
         def __on_response(_dialog, result):
             """Run if the user selects a file."""
             try:
-                __on_save_file(_dialog.save_finish(result))
+                file = _dialog.save_finish(result)
             except GLib.GError:
-                pass
+                return
+
+            # GTK makes the filter the user picked the default one. Picking
+            # another format than plain text beats the file's extension,
+            # which can't be changed from within the sandbox.
+            filter_format = filter_formats.get(_dialog.get_default_filter(), "txt")
+            if filter_format == "txt":
+                file_format = export.format_for_filename(file.get_basename())
+            else:
+                file_format = filter_format
+            __on_save_file(file, file_format)
+
+        file_filters = Gio.ListStore.new(Gtk.FileFilter)
+        filter_formats = {}
+        for file_format, name, patterns in (
+            ("txt", _("Plain text"), ["*.txt"]),
+            ("ans", _("ANSI colored text"), ["*.ans", "*.ansi"]),
+            ("html", _("HTML document"), ["*.html", "*.htm"]),
+        ):
+            file_filter = Gtk.FileFilter.new()
+            file_filter.set_name(name)
+            for pattern in patterns:
+                file_filter.add_pattern(pattern)
+            file_filters.append(file_filter)
+            filter_formats[file_filter] = file_format
 
         dialog = Gtk.FileDialog.new()
+        dialog.set_filters(file_filters)
+        dialog.set_default_filter(file_filters.get_item(0))
         dialog.set_initial_name("output.txt")
         dialog.save(callback=__on_response, parent=parent)
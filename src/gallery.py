@@ -0,0 +1,178 @@
+# gallery.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from gi.repository import Adw, GLib, Gtk
+
+from . import animation, image_identity, image_loader, renderer
+
+
+class GalleryItem:
+    """An image queued in the gallery, and its conversion once done.
+
+    The decoded image isn't kept, so that long queues only hold their
+    renderings. It is decoded again when the output needs it.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.width = None
+        self.identity = None
+        self.rendering = None
+        self.animated = False
+
+        self.row = Adw.ActionRow(
+            title=GLib.markup_escape_text(file.get_basename()),
+            subtitle=_("Waiting"),
+            activatable=False,
+        )
+        self.status = Gtk.Stack()
+        self.status.add_named(Adw.Spinner(), "busy")
+        self.status.add_named(Gtk.Image(icon_name="object-select-symbolic"), "done")
+        self.status.add_named(Gtk.Image(icon_name="dialog-warning-symbolic"), "failed")
+        self.row.add_suffix(self.status)
+
+
+class Gallery:
+    """Convert many images concurrently, listing them in a sidebar.
+
+    Images are converted on `scheduler` on behalf of `owner`, and
+    results appear in `list_box` as they finish. Activating a converted
+    image passes its GalleryItem to `on_item_activated`.
+    """
+
+    def __init__(self, list_box, progress_bar, on_item_activated, scheduler, owner):
+        self.__list_box = list_box
+        self.__progress_bar = progress_bar
+        self.__on_item_activated = on_item_activated
+        self.__scheduler = scheduler
+        self.__owner = owner
+
+        self.__items = []
+        self.__finished = 0
+
+        # Digests of images already queued, shared with the worker threads
+        self.__digests = {}
+        self.__digests_lock = threading.Lock()
+
+        list_box.connect("row-activated", self.__on_row_activated)
+
+    def __len__(self):
+        return len(self.__items)
+
+    def add_files(self, files, width, backend, max_memory):
+        for file in files:
+            item = GalleryItem(file)
+            self.__items.append(item)
+            self.__list_box.append(item.row)
+            self.__scheduler.submit(
+                self.__owner, self.__convert, item, width, backend, max_memory
+            ).add_done_callback(
+                lambda future, item=item: future.cancelled()
+                or GLib.idle_add(self.__on_converted, item, future)
+            )
+        self.__update_progress()
+
+    def __convert(self, item, width, backend, max_memory):
+        """Load and convert an item, on a worker thread.
+
+        Returns the item already holding the same image, if any.
+        """
+        GLib.idle_add(item.row.set_subtitle, _("Converting"))
+
+        filepath = item.file.get_path()
+        identity = image_identity.ImageIdentity(image_identity.file_digest(filepath))
+        with self.__digests_lock:
+            original = self.__digests.setdefault(identity.digest, item)
+        if original is not item:
+            return original
+
+        image = image_loader.load(filepath, max_memory, width)
+        identity.perceptual_hash = image_identity.perceptual_hash(image)
+        rendering = renderer.convert(image, width, backend)
+
+        item.width, item.identity = width, identity
+        item.rendering = rendering
+        item.animated = animation.is_animated(filepath)
+        return None
+
+    def __on_converted(self, item, future):
+        self.__finished += 1
+        self.__update_progress()
+
+        try:
+            original = future.result()
+        except Exception as error:
+            print(f"Unable to convert {item.file.get_path()}: {error}")
+            item.status.set_visible_child_name("failed")
+            if isinstance(error, image_loader.ImageTooLargeError):
+                item.row.set_subtitle(_("Too large to open"))
+            elif isinstance(error, IOError):
+                item.row.set_subtitle(_("Not a supported image type"))
+            else:
+                item.row.set_subtitle(_("Conversion failed"))
+            return GLib.SOURCE_REMOVE
+
+        if original is not None:
+            item.status.set_visible_child_name("failed")
+            # Translators: Do not translate "{basename}"
+            item.row.set_subtitle(
+                _("Same image as “{basename}”").format(
+                    basename=GLib.markup_escape_text(original.file.get_basename())
+                )
+            )
+            return GLib.SOURCE_REMOVE
+
+        item.status.set_visible_child_name("done")
+        item.row.set_activatable(True)
+        similar = next(
+            (
+                other
+                for other in self.__items
+                if other is not item
+                and other.identity is not None
+                and other.identity.looks_like(item.identity)
+            ),
+            None,
+        )
+        if similar is None:
+            item.row.set_subtitle(_("Converted"))
+        else:
+            # Translators: Do not translate "{basename}"
+            item.row.set_subtitle(
+                _("Looks like “{basename}”").format(
+                    basename=GLib.markup_escape_text(similar.file.get_basename())
+                )
+            )
+
+        # Show the first image as soon as it is ready
+        if not any(other.row.is_selected() for other in self.__items):
+            self.__list_box.select_row(item.row)
+            self.__on_item_activated(item)
+        return GLib.SOURCE_REMOVE
+
+    def __on_row_activated(self, list_box, row):
+        item = next(item for item in self.__items if item.row is row)
+        self.__on_item_activated(item)
+
+    def __update_progress(self):
+        total = len(self.__items)
+        self.__progress_bar.set_fraction(self.__finished / total if total else 0)
+        self.__progress_bar.set_visible(self.__finished < total)
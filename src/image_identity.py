@@ -0,0 +1,71 @@
+# image_identity.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import hashlib
+
+# Images whose perceptual hashes differ in at most this many bits look alike
+SIMILARITY_THRESHOLD = 4
+
+
+class ImageIdentity:
+    """Identify an image by its exact bytes, and loosely by its looks.
+
+    Two identities are equal if their digests are; the perceptual hash
+    survives re-encoding and resizing, which makes it suitable for
+    spotting duplicates.
+    """
+
+    def __init__(self, digest, perceptual_hash=None):
+        self.digest = digest
+        self.perceptual_hash = perceptual_hash
+
+    def looks_like(self, other):
+        if self.perceptual_hash is None or other.perceptual_hash is None:
+            return self == other
+
+        distance = (self.perceptual_hash ^ other.perceptual_hash).bit_count()
+        return distance <= SIMILARITY_THRESHOLD
+
+    def __eq__(self, other):
+        return isinstance(other, ImageIdentity) and self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+
+def file_digest(filepath):
+    """Hash the bytes of the file at `filepath` without decoding it."""
+    with open(filepath, "rb") as file:
+        return hashlib.file_digest(file, hashlib.blake2b).hexdigest()
+
+
+def bytes_digest(data):
+    return hashlib.blake2b(data).hexdigest()
+
+
+def perceptual_hash(img):
+    """Compute a 64-bit difference hash of a PIL image."""
+    pixels = img.convert("L").resize((9, 8)).tobytes()
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = (value << 1) | (left > pixels[row * 9 + column + 1])
+    return value
@@ -0,0 +1,287 @@
+# image_loader.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import struct
+import zlib
+
+from PIL import Image, ImageOps
+
+# Importing the plugins of the supported formats registers them
+from PIL import GifImagePlugin, JpegImagePlugin, PngImagePlugin, WebPImagePlugin
+
+from . import memory_budget, supported_formats, tracing
+
+# Images are prepared to cover at least this size, and wider outputs get
+# at least one pixel per column
+PREVIEW_SIZE = (500, 500)
+
+# How much larger than the preview images are kept before resampling,
+# so that cheap integer reduction doesn't cost any quality
+REDUCING_GAP = 2
+
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024
+
+# PNG images that are reduced are decoded in strips of about this many
+# bytes, so their size doesn't matter
+STRIP_SIZE = 16 * 1024 * 1024
+
+# Bits per pixel of the PNG modes whose raw data is stored as is
+_STRIP_MODE_BITS = {"1": 1, "L": 8, "LA": 16, "P": 8, "RGB": 24, "RGBA": 32}
+
+
+class ImageTooLargeError(Exception):
+    """Raised when decoding an image would exceed the memory ceiling."""
+
+
+def open_image(filepath):
+    """Open the image at `filepath`, if it is of a supported type.
+
+    Unlike `Image.open`, this skips Pillow's decompression bomb check,
+    since `load` bounds the memory used by decoding on its own. Raises
+    an IOError if the file is not of a supported image type.
+    """
+    with open(filepath, "rb") as file:
+        prefix = file.read(16)
+
+    for file_format in supported_formats.formats:
+        factory, accept = Image.OPEN[file_format.upper()]
+        # Some plugins return a message instead of False
+        accepted = accept is None or accept(prefix)
+        if accepted and not isinstance(accepted, str):
+            return factory(filepath)
+
+    raise Image.UnidentifiedImageError(f"cannot identify image file {filepath!r}")
+
+
+def load(filepath, max_memory=DEFAULT_MAX_MEMORY, width=0):
+    """Decode the image at `filepath` and prepare it for conversion.
+
+    The image is prepared for outputs up to `width` characters wide,
+    see `preview_size`. JPEG images are decoded at a reduced scale, and
+    large PNG images a strip at a time, so the memory needed depends on
+    the preview size rather than on the source. Other images must be
+    decoded fully, and raise an ImageTooLargeError if that would take
+    more than `max_memory` bytes. Images decoded on other threads share
+    the default memory budget, so this may wait for them.
+
+    The returned image no longer depends on the file. Raises an IOError
+    if the file is not of a supported image type.
+    """
+    with open_image(filepath) as img:
+        source_size = img.size
+        target_size = preview_size(width, source_size)
+        img.draft(img.mode, _cover_size(img.size, target_size, REDUCING_GAP))
+
+        decoded_size = img.width * img.height * len(img.getbands())
+        if _can_decode_strips(img):
+            factor = _reduce_factor(img.size, target_size)
+            if decoded_size > max_memory:
+                # Closer to the target size, rather than not at all
+                factor = max(factor, _reduce_factor(img.size, target_size, 1))
+            if factor > 1:
+                with tracing.span("decode", format=img.format, size=img.size):
+                    img = _decode_strips(img, factor, max_memory)
+                return _prepare(img, source_size, width)
+
+        if decoded_size > max_memory:
+            raise ImageTooLargeError(
+                f"Decoding {img.width}×{img.height} pixels needs {decoded_size} bytes"
+            )
+
+        with memory_budget.get_default().reserve(decoded_size):
+            with tracing.span("decode", format=img.format, size=img.size):
+                img.load()
+            return _prepare(img, source_size, width)
+
+
+def prepare(img, width=0):
+    """Downscale `img` for outputs up to `width` characters wide.
+
+    Also applies its EXIF orientation.
+    """
+    return _prepare(img, img.size, width)
+
+
+def preview_size(width, source_size):
+    """Return the size to cover when preparing an image for `width` columns.
+
+    Outputs wider than PREVIEW_SIZE get at least one pixel per column,
+    unless the source, of `source_size`, has fewer.
+    """
+    side = max(PREVIEW_SIZE[0], min(int(width), *source_size))
+    return side, side
+
+
+def has_detail_for(img, width):
+    """Whether `img`, as prepared for some width, suits `width` columns too."""
+    source_size = img.info.get("source_size", img.size)
+    return min(img.size) >= preview_size(width, source_size)[0]
+
+
+def _prepare(img, source_size, width):
+    target_size = preview_size(width, source_size)
+    with tracing.span("resize", size=img.size):
+        factor = _reduce_factor(img.size, target_size)
+        if factor > 1:
+            img = _reduce(img, factor)
+
+        shrunken_img = ImageOps.cover(img, target_size)
+
+    with tracing.span("exif_transpose"):
+        prepared_img = ImageOps.exif_transpose(shrunken_img)
+    # Lets `has_detail_for` tell whether loading again would add detail
+    prepared_img.info["source_size"] = source_size
+    return prepared_img
+
+
+def _reduce(img, factor):
+    reduced_img = _reducible(img).reduce(factor)
+    # Keep the metadata exif_transpose needs
+    reduced_img.info = img.info
+    return reduced_img
+
+
+def _reducible(img):
+    """Convert `img` to a mode that `Image.reduce` supports, if needed."""
+    if img.mode == "1":
+        return img.convert("L")
+    if img.mode == "P":
+        return img.convert("RGB")
+    return img
+
+
+def _reduce_factor(size, target_size, gap=REDUCING_GAP):
+    """Return how much an image of the given size can be reduced by cheaply."""
+    cover_width, cover_height = _cover_size(size, target_size)
+    return min(size[0] // cover_width, size[1] // cover_height) // gap
+
+
+def _can_decode_strips(img):
+    """Whether `img` is a PNG image `_decode_strips` can decode."""
+    return (
+        img.format == "PNG"
+        and not img.info.get("interlace")
+        and len(img.tile) == 1
+        and img.tile[0][0] == "zip"
+        # Every strip continues from the raw data of the last row
+        and img.tile[0][3] == img.mode
+        and img.mode in _STRIP_MODE_BITS
+    )
+
+
+def _decode_strips(img, factor, max_memory):
+    """Decode a PNG image a strip at a time, reducing it by `factor`.
+
+    Strips span a multiple of `factor` rows, so the result is the same
+    as reducing the fully decoded image.
+    """
+    width, height = img.size
+    row_size = (width * _STRIP_MODE_BITS[img.mode] + 7) // 8 + 1
+    strip_rows = max(1, STRIP_SIZE // row_size // factor) * factor
+
+    reduced_img = Image.new(
+        _reducible(Image.new(img.mode, (1, 1))).mode,
+        (-(-width // factor), -(-height // factor)),
+    )
+    # The compressed strip, a copy of it and the decoded strip
+    strip_memory = 3 * min(strip_rows + 1, height) * row_size
+    reduced_size = reduced_img.width * reduced_img.height * len(reduced_img.getbands())
+    needed_size = strip_memory + reduced_size
+    if needed_size > max_memory:
+        raise ImageTooLargeError(
+            f"Decoding {width}×{height} pixels needs {needed_size} bytes"
+        )
+
+    with memory_budget.get_default().reserve(strip_memory):
+        with open(img.filename, "rb") as file:
+            data = _PngData(file)
+            previous_row = b""
+            for top in range(0, height, strip_rows):
+                rows = min(strip_rows, height - top)
+                strip_data = data.read(rows * row_size)
+                if len(strip_data) < rows * row_size:
+                    raise OSError("Truncated PNG image data")
+
+                # Start from the previous row, stored unfiltered
+                extra_rows = 1 if previous_row else 0
+                strip = Image.frombytes(
+                    img.mode,
+                    (width, rows + extra_rows),
+                    zlib.compress(previous_row + strip_data, 0),
+                    "zip",
+                    img.mode,
+                )
+                if img.mode == "P":
+                    rawmode, palette = img.palette.getdata()
+                    strip.putpalette(palette, rawmode)
+
+                previous_row = b"\0" + strip.crop(
+                    (0, strip.height - 1, width, strip.height)
+                ).tobytes("raw", img.mode)
+                strip = strip.crop((0, extra_rows, width, strip.height))
+                reduced_img.paste(_reducible(strip).reduce(factor), (0, top // factor))
+
+    reduced_img.info = img.info
+    return reduced_img
+
+
+class _PngData:
+    """Read the decompressed image data of a PNG file, a piece at a time."""
+
+    def __init__(self, file):
+        self.__file = file
+        self.__file.seek(8)
+        self.__decompressor = zlib.decompressobj()
+        self.__pending = b""
+
+    def read(self, size):
+        """Return the next `size` bytes, or fewer if the data ends."""
+        output = bytearray()
+        while len(output) < size:
+            if not self.__pending:
+                self.__pending = self.__next_chunk()
+                if not self.__pending:
+                    break
+
+            output += self.__decompressor.decompress(self.__pending, size - len(output))
+            self.__pending = self.__decompressor.unconsumed_tail
+        return bytes(output)
+
+    def __next_chunk(self):
+        """Return the contents of the next IDAT chunk, or b"" after the last."""
+        while True:
+            header = self.__file.read(8)
+            if len(header) < 8:
+                return b""
+
+            length, chunk_type = struct.unpack(">I4s", header)
+            if chunk_type == b"IEND":
+                return b""
+            if chunk_type == b"IDAT":
+                chunk = self.__file.read(length)
+                self.__file.seek(4, 1)
+                return chunk
+            self.__file.seek(length + 4, 1)
+
+
+def _cover_size(size, target_size, scale=1):
+    """Return the smallest size covering `target_size`, times `scale`."""
+    width, height = size
+    ratio = max(target_size[0] / width, target_size[1] / height) * scale
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
@@ -0,0 +1,48 @@
+# lazy_import.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import importlib.util
+import sys
+
+
+def module(name, package=None):
+    """Return the module `name`, executing it only once an attribute is used.
+
+    Executing a lazy module isn't thread-safe before Python 3.12, so
+    `resolve` it on the main thread before handing it to other threads.
+    """
+    name = importlib.util.resolve_name(name, package)
+    try:
+        return sys.modules[name]
+    except KeyError:
+        pass
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    lazy_module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = lazy_module
+    loader.exec_module(lazy_module)
+    return lazy_module
+
+
+def resolve(*modules):
+    """Execute lazy `modules` now, if they haven't been yet."""
+    for lazy_module in modules:
+        getattr(lazy_module, "__name__")
@@ -17,7 +17,9 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
 import sys
+import time
 
 import gi
 
@@ -26,24 +28,36 @@ gi.require_version("Adw", "1")
 
 from gi.repository import Adw, Gdk, Gio, GLib, Gtk
 
-from .file_chooser import FileChooser
-from .pasting import Paster
+from .dbus_service import ConversionService
+from .shared_state import SharedState
 from .window import LetterpressWindow
-from .tips_dialog import TipsDialog
+from . import tracing
 
 from .profile import APP_ID, PROFILE
 
+# Milliseconds an instance without windows waits for D-Bus calls before exiting
+SERVICE_INACTIVITY_TIMEOUT = 60 * 1000
+
 
 class LetterpressApplication(Adw.Application):
     """The main application singleton class."""
 
-    def __init__(self):
+    def __init__(self, startup_benchmark=False):
+        flags = Gio.ApplicationFlags.HANDLES_COMMAND_LINE
+        if startup_benchmark:
+            # Always measure a cold start, never an already running instance
+            flags |= Gio.ApplicationFlags.NON_UNIQUE
+
         super().__init__(
             application_id=APP_ID,
-            flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE,
+            flags=flags,
             resource_base_path="/io/gitlab/gregorni/Letterpress",
         )
+        self.__startup_benchmark = startup_benchmark
         self.__create_action("quit", lambda *args: self.quit(), ["<primary>q"])
+        self.__create_action(
+            "new-window", lambda *args: self.__new_window(), ["<primary>n"]
+        )
         self.__create_action("tips", self.__on_tips_action)
         self.__create_action("about", self.__on_about_action)
         self.__create_action(
@@ -65,52 +79,114 @@ class LetterpressApplication(Adw.Application):
         self.__create_action(
             "copy-output", self.__copy_output_to_clipboard, ["<primary>c"]
         )
-        self.__create_action(
-            "save-output", self.__save_output_to_file, ["<primary>s"]
-        )
+        self.__create_action("save-output", self.__save_output_to_file, ["<primary>s"])
         self.__create_action(
             "open-output", self.__open_output, param=GLib.VariantType("s")
         )
-        self.file = None
+
+        settings = Gio.Settings(schema_id="io.gitlab.gregorni.Letterpress")
+        self.add_action(settings.create_action("watch-file"))
+        self.shared_state = SharedState(settings)
+        self.__service = ConversionService(
+            settings, self.shared_state, self.__on_service_busy
+        )
+
+        if PROFILE == "development":
+            tracing.enable()
+        if tracing.is_enabled():
+            self.__create_action(
+                "toggle-trace-overlay",
+                lambda *args: self.get_active_window().toggle_trace_overlay(),
+                ["<primary><shift>t"],
+            )
+        self.files = []
 
     def do_activate(self):
         """Called when the application is activated.
 
         We raise the application's main window, creating it if
-        necessary.
+        necessary. Every file passed on the command line opens in a
+        window of its own, reusing the active one if it has no image.
         """
         win = self.get_active_window()
         if win == None:
-            win = LetterpressWindow(application=self)
-        win.present()
+            win = self.__new_window()
+        else:
+            win.present()
 
+        for index, file in enumerate(self.files):
+            if index > 0 or win.rendering is not None:
+                win = self.__new_window()
+
+            # Let the window draw before the image is decoded
+            win.main_stack.set_visible_child_name("spinner-page")
+            GLib.idle_add(
+                win.check_is_image,
+                Gio.File.new_for_path(file),
+                priority=GLib.PRIORITY_LOW,
+            )
+        self.files = []
+
+    def __new_window(self):
+        win = LetterpressWindow(application=self)
         if PROFILE == "development":
             win.add_css_class("devel")
+        win.present()
+        if self.__startup_benchmark:
+            win.get_frame_clock().connect("after-paint", self.__on_first_frame)
+        return win
 
-        if self.file != None:
-            win.check_is_image(Gio.File.new_for_path(self.file))
+    def do_dbus_register(self, connection, object_path):
+        Adw.Application.do_dbus_register(self, connection, object_path)
+        self.__service.register(connection, object_path)
+
+        # Started with --gapplication-service, stay around between calls
+        if self.get_flags() & Gio.ApplicationFlags.IS_SERVICE:
+            self.set_inactivity_timeout(SERVICE_INACTIVITY_TIMEOUT)
+        return True
+
+    def do_dbus_unregister(self, connection, object_path):
+        self.__service.unregister(connection)
+        Adw.Application.do_dbus_unregister(self, connection, object_path)
+
+    def __on_service_busy(self, busy):
+        if busy:
+            self.hold()
+        else:
+            self.release()
+
+    def __on_first_frame(self, frame_clock):
+        frame_clock.disconnect_by_func(self.__on_first_frame)
+        startup_time = _seconds_since_launch()
+        if startup_time is not None:
+            print(f"Time to first frame: {startup_time * 1000:.0f} ms")
+        self.quit()
 
     def __paste_image(self, *args):
+        from .pasting import Paster
+
         win = self.get_active_window()
-        Paster().paste_image(win, win.check_is_image)
+        Paster().paste_image(win, win.open_files, win.load_texture)
 
     def __change_output_width(self, down):
         win = self.get_active_window()
-        if win.filepath != None:
+        if win.rendering != None:
             spin_btn = win.width_spin
             spin_btn.set_value(spin_btn.get_value() + (-10 if down else 10))
 
     def __copy_output_to_clipboard(self, *args):
         win = self.get_active_window()
-        if win.filepath is None:
+        if win.rendering is None:
             return
-        output_text = win.output_label.get_label()
+        output_text = win.get_output_text()
         Gdk.Display.get_default().get_clipboard().set(output_text)
         win.toast_overlay.add_toast(Adw.Toast(title=_("Output copied to clipboard")))
 
     def __save_output_to_file(self, *args):
+        from .file_chooser import FileChooser
+
         win = self.get_active_window()
-        if win.filepath is None:
+        if win.rendering is None:
             return
         FileChooser.save_file(win)
 
@@ -137,9 +213,9 @@ class LetterpressApplication(Adw.Application):
 
     def do_command_line(self, command_line):
         args = command_line.get_arguments()
-        if len(args) > 1:
-            file = command_line.create_file_for_arg(args[1])
-            self.file = file.get_path()
+        self.files = [
+            command_line.create_file_for_arg(arg).get_path() for arg in args[1:]
+        ]
         self.activate()
         return 0
 
@@ -183,6 +259,8 @@ class LetterpressApplication(Adw.Application):
         about.present(self.get_active_window())
 
     def __on_tips_action(self, *args):
+        from .tips_dialog import TipsDialog
+
         TipsDialog().present(self.get_active_window())
 
     def __create_action(self, name, callback, shortcuts=None, param=None):
@@ -204,4 +282,27 @@ class LetterpressApplication(Adw.Application):
 
 def main(version):
     """The application's entry point."""
-    return LetterpressApplication().run(sys.argv)
+    if "--batch" in sys.argv[1:]:
+        # Headless conversions never need a display or a primary instance
+        from . import batch
+
+        return batch.main(sys.argv[1:])
+
+    startup_benchmark = "--startup-benchmark" in sys.argv[1:]
+    if startup_benchmark:
+        sys.argv.remove("--startup-benchmark")
+
+    return LetterpressApplication(startup_benchmark).run(sys.argv)
+
+
+def _seconds_since_launch():
+    """Return how long ago the process was started, on Linux."""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as file:
+            # Fields after the command name, which may contain spaces
+            fields = file.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+
+    start_time = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - start_time
@@ -0,0 +1,71 @@
+# memory_budget.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+from contextlib import contextmanager
+
+DEFAULT_SIZE = 256 * 1024 * 1024
+
+_budget = None
+_lock = threading.Lock()
+
+
+class MemoryBudget:
+    """Limit the memory used by work running at once, such as decoding.
+
+    `reserve` waits until enough of the budget is free. Amounts larger
+    than the whole budget are reduced to it, so they run alone rather
+    than never.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.__size = size
+        self.used = 0
+        self.__condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, amount):
+        with self.__condition:
+            amount = min(amount, self.__size)
+            self.__condition.wait_for(lambda: self.used + amount <= self.__size)
+            self.used += amount
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.used -= amount
+                self.__condition.notify_all()
+
+    def set_size(self, size):
+        with self.__condition:
+            self.__size = size
+            self.__condition.notify_all()
+
+    def __str__(self):
+        return f"{self.used} of {self.__size} bytes"
+
+
+def get_default():
+    """Return the budget shared by the whole process."""
+    global _budget
+
+    with _lock:
+        if _budget is None:
+            _budget = MemoryBudget()
+        return _budget
@@ -0,0 +1,103 @@
+# output_view.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from gi.repository import Gtk, Pango
+
+from . import lazy_import, tracing
+
+renderer = lazy_import.module(".renderer", __package__)
+
+
+class OutputView(Gtk.ListView):
+    """Show ASCII art one row per list item.
+
+    Only the rows in view have a widget, so Pango never lays out more
+    than a screenful of text, however large the output is. Colored rows
+    get one foreground attribute per run of equal colors, rather than
+    one per glyph.
+    """
+
+    __gtype_name__ = "LetterpressOutputView"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.__rows = Gtk.StringList()
+        self.__colors = None
+        self.set_model(Gtk.NoSelection(model=self.__rows))
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.__on_setup)
+        factory.connect("bind", self.__on_bind)
+        self.set_factory(factory)
+
+    def set_rows(self, rows, colors=None):
+        """Show `rows`, colored by the RGB grid `colors` if given."""
+        span = tracing.span("layout", rows=len(rows))
+        self.__colors = colors
+        self.__rows.splice(0, self.__rows.get_n_items(), rows)
+        self.__end_after_paint(span)
+
+    def replace_rows(self, positions, rows, colors=None):
+        """Replace the rows at `positions`, leaving every other row alone."""
+        span = tracing.span("layout", rows=len(rows))
+        if self.__colors is not None and colors is not None:
+            self.__colors[list(positions)] = colors
+        for position, row in zip(positions, rows):
+            self.__rows.splice(int(position), 1, [row])
+        self.__end_after_paint(span)
+
+    def __end_after_paint(self, span):
+        """End `span` once the new rows are laid out and drawn."""
+        frame_clock = self.get_frame_clock()
+        if not tracing.is_enabled() or frame_clock is None:
+            span.end()
+            return
+
+        def __on_after_paint(frame_clock):
+            frame_clock.disconnect(handler)
+            span.end()
+
+        handler = frame_clock.connect("after-paint", __on_after_paint)
+
+    def __on_setup(self, factory, list_item):
+        label = Gtk.Label(xalign=0, accessible_role=Gtk.AccessibleRole.NONE)
+        label.add_css_class("monospace")
+        list_item.set_child(label)
+        list_item.set_activatable(False)
+        list_item.set_focusable(False)
+
+    def __on_bind(self, factory, list_item):
+        label = list_item.get_child()
+        label.set_label(list_item.get_item().get_string())
+
+        if self.__colors is None:
+            label.set_attributes(None)
+            return
+
+        attributes = Pango.AttrList()
+        # Glyphs are ASCII, so glyph indices are byte indices
+        for start, stop, (red, green, blue) in renderer.color_runs(
+            self.__colors[list_item.get_position()]
+        ):
+            attribute = Pango.attr_foreground_new(red * 257, green * 257, blue * 257)
+            attribute.start_index = start
+            attribute.end_index = stop
+            attributes.insert(attribute)
+        label.set_attributes(attributes)
@@ -17,23 +17,22 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from gi.repository import Adw, Gdk, Gio
-
-from . import texture_to_file
+from gi.repository import Adw, Gdk
 
 
 class Paster:
-    def paste_image(self, parent_window, callback):
+    def paste_image(self, parent_window, callback, texture_callback):
         self.parent_window = parent_window
         self.callback = callback
+        self.texture_callback = texture_callback
 
         clipboard = Gdk.Display.get_default().get_clipboard()
-        clipboard.read_value_async(Gio.File, 0, None, self.__on_file_pasted)
+        clipboard.read_value_async(Gdk.FileList, 0, None, self.__on_files_pasted)
 
-    def __on_file_pasted(self, clipboard, result):
+    def __on_files_pasted(self, clipboard, result):
         try:
-            paste_as_file = clipboard.read_value_finish(result)
-            self.callback(paste_as_file)
+            paste_as_files = clipboard.read_value_finish(result).get_files()
+            self.callback(paste_as_files)
 
         except:
             clipboard.read_texture_async(None, self.__on_texture_pasted)
@@ -41,8 +40,7 @@ class Paster:
     def __on_texture_pasted(self, clipboard, result):
         try:
             paste_as_texture = clipboard.read_texture_finish(result)
-            file = texture_to_file.to_file(paste_as_texture)
-            self.callback(file)
+            self.texture_callback(paste_as_texture)
 
         except:
             toast = Adw.Toast.new(_("No image found in clipboard"))
@@ -0,0 +1,48 @@
+# process_pool.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_executor = None
+_lock = threading.Lock()
+
+
+def new(max_workers=None):
+    """Create a process pool that is safe to use from a threaded program.
+
+    Workers are started by a fork server rather than forked from a
+    process that may be running GTK.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("forkserver"),
+    )
+
+
+def get_default():
+    """Return the process pool shared by the whole application."""
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            _executor = new()
+        return _executor
@@ -0,0 +1,91 @@
+# render_cache.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """Keep recent renders, evicting the least recently used ones.
+
+    Entries are keyed by (image digest, width, backend), and the cache
+    holds at most `max_size` bytes of renderings. It can be shared by
+    several windows and threads.
+    """
+
+    def __init__(self, max_size):
+        self.__entries = OrderedDict()
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.__lock:
+            try:
+                value = self.__entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.__lock:
+            if key in self.__entries:
+                self.size -= sys.getsizeof(self.__entries.pop(key))
+
+            value_size = sys.getsizeof(value)
+            if value_size > self.__max_size:
+                return
+
+            self.__entries[key] = value
+            self.size += value_size
+            self.__evict()
+
+    def set_max_size(self, max_size):
+        with self.__lock:
+            self.__max_size = max_size
+            self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def __evict(self):
+        while self.size > self.__max_size:
+            _key, value = self.__entries.popitem(last=False)
+            self.size -= sys.getsizeof(value)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __str__(self):
+        return (
+            f"{len(self)} renders, {self.size} bytes, "
+            f"{self.hits} hits, {self.misses} misses"
+        )
@@ -0,0 +1,402 @@
+# renderer.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import subprocess
+from multiprocessing import shared_memory
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+from . import tracing
+
+# artem's default density, from the densest to the sparsest glyph
+DENSITY = (
+    "@MBHENR#KWXDFPQASUZbdehx*8Gm&04LOVYkpq5Tagns69owz$CIu23Jcfry%1v7l+it[]{}?j|()"
+    "=~!-/<>\"^_';,:`. "
+)
+
+# Characters are roughly twice as high as they are wide
+CHARACTER_RATIO = 0.42
+
+BACKENDS = ["builtin", "artem"]
+
+# The widest output, in characters, offered by the width spin button in
+# window.blp and accepted over D-Bus
+MAX_WIDTH = 4000
+
+# Bump whenever the same image and width start rendering differently,
+# so that persisted renderings are not reused
+RENDERER_VERSION = 2
+
+# Grids with at least this many cells are rendered in bands on a process
+# pool, if one is given
+PARALLEL_CELLS = 1_000_000
+
+# Colored output snaps every channel to this many steps, the 216 colors
+# of the xterm color cube, so that neighbouring cells share colors
+PALETTE_STEPS = 6
+
+# Maps every luminance value to a position on the density ramp
+_LEVELS = ((np.arange(256) * (len(DENSITY) - 1) + 127) // 255).astype(np.uint8)
+
+# Glyph tables indexed by level, sparsest glyph first
+_GLYPHS = np.frombuffer(DENSITY[::-1].encode("ascii"), dtype=np.uint8)
+_INVERTED_GLYPHS = _GLYPHS[::-1].copy()
+
+# Maps glyphs back to their level, for reading artem's output
+_GLYPH_LEVELS = np.zeros(256, dtype=np.uint8)
+_GLYPH_LEVELS[_GLYPHS] = np.arange(len(_GLYPHS), dtype=np.uint8)
+
+_NEWLINE = ord("\n")
+
+
+class Rendering:
+    """A converted image, independent of the color scheme.
+
+    Every cell holds its position on the density ramp, so switching the
+    color scheme only remaps the levels to glyphs. `colors` holds the
+    average RGB color of every cell, if known.
+    """
+
+    def __init__(self, levels, colors=None):
+        self.levels = levels
+        self.colors = colors
+
+    @classmethod
+    def from_text(cls, text):
+        """Read the levels back from non-inverted ASCII art."""
+        lines = text.splitlines()
+        columns = max((len(line) for line in lines), default=0)
+        padded = "".join(line.ljust(columns) for line in lines)
+
+        glyphs = np.frombuffer(padded.encode("ascii", "replace"), dtype=np.uint8)
+        return cls(_GLYPH_LEVELS[glyphs].reshape(len(lines), columns))
+
+    @classmethod
+    def empty(cls, rows, columns):
+        """Create a blank, black Rendering to fill in later."""
+        return cls(
+            np.zeros((rows, columns), dtype=np.uint8),
+            np.zeros((rows, columns, 3), dtype=np.uint8),
+        )
+
+    @property
+    def columns(self):
+        return self.levels.shape[1]
+
+    @property
+    def rows(self):
+        return self.levels.shape[0]
+
+    def to_text(self, invert=False, start=0, stop=None):
+        """Map the levels of rows `start` to `stop` to glyphs, one line per row.
+
+        Mirrors artem's `--invert` option: without `invert`, bright
+        areas get dense glyphs, which suits light text on a dark
+        background.
+        """
+        levels = self.levels[start:stop]
+        glyphs = _INVERTED_GLYPHS if invert else _GLYPHS
+        output = np.empty((levels.shape[0], self.columns + 1), dtype=np.uint8)
+        output[:, :-1] = glyphs[levels]
+        output[:, -1] = _NEWLINE
+        return output.tobytes().decode("ascii")
+
+    def to_rows(self, invert=False, start=0, stop=None):
+        return self.to_text(invert, start, stop).splitlines()
+
+    def __sizeof__(self):
+        size = object.__sizeof__(self) + self.levels.nbytes
+        if self.colors is not None:
+            size += self.colors.nbytes
+        return size
+
+
+def grid_size(image_size, width):
+    """Return the number of columns and rows for an image of the given size."""
+    image_width, image_height = image_size
+    columns = max(1, int(width))
+    rows = max(1, round(image_height * columns / image_width * CHARACTER_RATIO))
+    return columns, rows
+
+
+def _cell_edges(length, cells):
+    return (np.arange(cells + 1, dtype=np.int64) * length) // cells
+
+
+def _block_means(pixels, row_edges, column_edges):
+    """Average `pixels` over the cells delimited by the given edges."""
+    sums = np.add.reduceat(pixels, row_edges[:-1], axis=0, dtype=np.int64)
+    sums = np.add.reduceat(sums, column_edges[:-1], axis=1, dtype=np.int64)
+
+    # Cells smaller than a pixel sample the nearest pixel instead
+    row_counts = np.maximum(np.diff(row_edges), 1)
+    column_counts = np.maximum(np.diff(column_edges), 1)
+    counts = row_counts[:, None] * column_counts[None, :]
+    return sums // counts.reshape(counts.shape + (1,) * (sums.ndim - 2))
+
+
+def convert(img, width, backend="builtin", executor=None):
+    """Convert a PIL image into a Rendering, `width` characters wide.
+
+    Large grids are rendered in bands on the process pool `executor`,
+    if given.
+    """
+    with tracing.span("convert", width=width, backend=backend):
+        if backend == "artem":
+            return Rendering.from_text(render_artem(img, width))
+        if executor is not None and is_large(img.size, width):
+            return stitch(render_bands(img, width, executor))
+        return render_levels(img, width)
+
+
+def is_large(image_size, width):
+    """Whether rendering in bands pays off for a grid of this size."""
+    columns, rows = grid_size(image_size, width)
+    return columns * rows >= PARALLEL_CELLS
+
+
+def stitch(bands):
+    """Join the bands yielded by `render_bands` into one Rendering."""
+    renderings = [rendering for _first, _last, rendering in bands]
+    return Rendering(
+        np.concatenate([rendering.levels for rendering in renderings]),
+        np.concatenate([rendering.colors for rendering in renderings]),
+    )
+
+
+def render_levels(img, width):
+    """Convert a PIL image into a Rendering, mirroring artem's `--size`."""
+    pixels = _pixels(img)
+    columns, rows = grid_size(img.size, width)
+
+    means = _block_means(
+        pixels,
+        _cell_edges(pixels.shape[0], rows),
+        _cell_edges(pixels.shape[1], columns),
+    )
+    return Rendering(_LEVELS[means[..., 0]], means[..., 1:].astype(np.uint8))
+
+
+def rerender(rendering, previous_img, img, width):
+    """Update the `rendering` of `previous_img` to show `img`.
+
+    Only the rows covering pixels that differ between the images are
+    averaged again, and the result is identical to rendering `img` from
+    scratch. Returns the new Rendering and the indices of the rows that
+    were redone.
+    """
+    columns, rows = grid_size(img.size, width)
+    if (
+        img.size != previous_img.size
+        or rendering.levels.shape != (rows, columns)
+        or rendering.colors is None
+    ):
+        rendering = render_levels(img, width)
+        return rendering, np.arange(rendering.rows)
+
+    with tracing.span("rerender", width=width):
+        pixels = _pixels(img)
+        changed_pixels = np.any(pixels != _pixels(previous_img), axis=(1, 2))
+
+        row_edges = _cell_edges(pixels.shape[0], rows)
+        starts, stops = _pixel_rows(row_edges)
+        changed_counts = np.concatenate(([0], np.cumsum(changed_pixels)))
+        changed = np.flatnonzero(changed_counts[stops] > changed_counts[starts])
+
+        levels = rendering.levels.copy()
+        colors = rendering.colors.copy()
+        for band in np.split(changed, np.flatnonzero(np.diff(changed) > 1) + 1):
+            if len(band) == 0:
+                continue
+
+            first, last = band[0], band[-1] + 1
+            means = _band_means(pixels, rows, columns, first, last)
+            levels[first:last] = _LEVELS[means[..., 0]]
+            colors[first:last] = means[..., 1:]
+        return Rendering(levels, colors), changed
+
+
+def render_bands(img, width, executor, band_count=None):
+    """Render horizontal bands of rows in parallel on a process pool.
+
+    The pixels are shared with the workers rather than pickled, and the
+    workers write their rows into shared memory too. Yields the first
+    and last row of every band with a Rendering of those rows, from top
+    to bottom, as soon as they are done. Stitched together, the bands
+    are identical to the output of `render_levels`.
+    """
+    pixels = _pixels(img)
+    columns, rows = grid_size(img.size, width)
+    if band_count is None:
+        band_count = 4 * (os.cpu_count() or 1)
+    band_edges = _cell_edges(rows, min(rows, band_count))
+
+    input_memory = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+    output_memory = shared_memory.SharedMemory(create=True, size=rows * columns * 4)
+    futures = []
+    try:
+        np.ndarray(pixels.shape, np.uint8, buffer=input_memory.buf)[:] = pixels
+        futures = [
+            executor.submit(
+                _render_band,
+                input_memory.name,
+                pixels.shape,
+                output_memory.name,
+                rows,
+                columns,
+                first,
+                last,
+            )
+            for first, last in zip(band_edges[:-1].tolist(), band_edges[1:].tolist())
+        ]
+
+        output = np.ndarray((rows, columns, 4), np.uint8, buffer=output_memory.buf)
+        for future in futures:
+            first, last = future.result()
+            yield first, last, Rendering(
+                output[first:last, :, 0].copy(), output[first:last, :, 1:].copy()
+            )
+        del output
+    finally:
+        for future in futures:
+            future.cancel()
+        for memory in (input_memory, output_memory):
+            memory.close()
+            memory.unlink()
+
+
+def _render_band(input_name, shape, output_name, rows, columns, first, last):
+    """Render rows `first` to `last` from shared memory, in a worker process."""
+    input_memory = shared_memory.SharedMemory(name=input_name)
+    output_memory = shared_memory.SharedMemory(name=output_name)
+    try:
+        pixels = np.ndarray(shape, np.uint8, buffer=input_memory.buf)
+        output = np.ndarray((rows, columns, 4), np.uint8, buffer=output_memory.buf)
+
+        means = _band_means(pixels, rows, columns, first, last)
+        output[first:last, :, 0] = _LEVELS[means[..., 0]]
+        output[first:last, :, 1:] = means[..., 1:]
+        # The buffers can't be closed while arrays still use them
+        del pixels, output
+    finally:
+        input_memory.close()
+        output_memory.close()
+    return first, last
+
+
+def _band_means(pixels, rows, columns, first, last):
+    """Average the cells of rows `first` to `last` only.
+
+    The cell edges are those of the whole grid, so the result matches
+    the same rows of a full render.
+    """
+    row_edges = _cell_edges(pixels.shape[0], rows)
+    starts, stops = _pixel_rows(row_edges)
+    return _block_means(
+        pixels[starts[first] : stops[last - 1]],
+        row_edges[first : last + 1] - starts[first],
+        _cell_edges(pixels.shape[1], columns),
+    )
+
+
+def _pixel_rows(row_edges):
+    """Return the first and last pixel row sampled by every row of cells."""
+    starts = row_edges[:-1]
+    # Cells smaller than a pixel still sample one
+    return starts, np.maximum(row_edges[1:], starts + 1)
+
+
+def rescale(rendering, width):
+    """Approximate `rendering` at another width, by nearest-neighbour sampling.
+
+    Far cheaper than converting again, which makes it suitable for
+    previews.
+    """
+    columns = max(1, int(width))
+    rows = max(1, round(rendering.rows * columns / rendering.columns))
+    row_indices = (np.arange(rows) * 2 + 1) * rendering.rows // (rows * 2)
+    column_indices = (np.arange(columns) * 2 + 1) * rendering.columns // (columns * 2)
+
+    levels = rendering.levels[row_indices[:, None], column_indices]
+    colors = None
+    if rendering.colors is not None:
+        colors = rendering.colors[row_indices[:, None], column_indices]
+    return Rendering(levels, colors)
+
+
+def changed_rows(previous, rendering):
+    """Return the indices of the rows that differ between two renderings.
+
+    Returns None if they don't have the same size.
+    """
+    if previous.levels.shape != rendering.levels.shape:
+        return None
+
+    changed = np.any(rendering.levels != previous.levels, axis=1)
+    if rendering.colors is not None and previous.colors is not None:
+        changed |= np.any(rendering.colors != previous.colors, axis=(1, 2))
+    return np.flatnonzero(changed)
+
+
+def _pixels(img):
+    """Stack the luminance and RGB channels of `img`, which are averaged at once."""
+    rgb_img = img.convert("RGB")
+    return np.dstack((np.asarray(rgb_img.convert("L")), np.asarray(rgb_img)))
+
+
+def quantize_colors(colors, steps=PALETTE_STEPS):
+    """Snap every channel of `colors` to `steps` evenly spaced values."""
+    indices = (colors.astype(np.uint16) * (steps - 1) + 127) // 255
+    return (indices * 255 // (steps - 1)).astype(np.uint8)
+
+
+def color_runs(colors):
+    """Yield the start, stop and RGB color of every run of equal colors in a row."""
+    changes = np.flatnonzero(np.any(colors[1:] != colors[:-1], axis=1)) + 1
+    starts = np.concatenate(([0], changes))
+    stops = np.concatenate((changes, [len(colors)]))
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        yield start, stop, colors[start].tolist()
+
+
+def render(img, width, invert=False):
+    """Convert a PIL image into ASCII art, `width` characters wide."""
+    return render_levels(img, width).to_text(invert)
+
+
+def render_artem(img, width, invert=False):
+    """Convert a PIL image by running artem on a temporary copy of it."""
+    with NamedTemporaryFile(suffix=".png") as file:
+        with tracing.span("temp_file"):
+            img.save(file, format="PNG")
+            file.flush()
+        return render_artem_file(file.name, width, invert)
+
+
+def render_artem_file(filepath, width, invert=False):
+    """Convert the image at `filepath` by running artem."""
+    arguments = ["artem", f"--size={int(width)}", filepath]
+    if invert:
+        arguments.append("--invert")
+
+    return subprocess.run(
+        arguments, stdout=subprocess.PIPE, universal_newlines=True, check=True
+    ).stdout
@@ -0,0 +1,86 @@
+# shared_state.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from . import lazy_import, memory_budget
+from .conversion_worker import ConversionScheduler
+from .render_cache import RenderCache
+
+# NumPy and Pillow are only imported once something needs converting
+animation = lazy_import.module(".animation", __package__)
+disk_cache = lazy_import.module(".disk_cache", __package__)
+export = lazy_import.module(".export", __package__)
+image_loader = lazy_import.module(".image_loader", __package__)
+renderer = lazy_import.module(".renderer", __package__)
+texture_to_file = lazy_import.module(".texture_to_file", __package__)
+
+
+class SharedState:
+    """The conversion threads and caches shared by every window.
+
+    The D-Bus service uses them too, so opening a second window or
+    answering a call neither starts more threads nor converts an image
+    that is cached already. Decoding is limited by one memory budget
+    for the whole application, which only counts the decodes running
+    at once, not the downscaled images windows keep afterwards.
+    """
+
+    def __init__(self, settings):
+        self.__settings = settings
+        self.scheduler = ConversionScheduler()
+        self.render_cache = RenderCache(self.__get_render_cache_size())
+        self.disk_cache = None
+
+        settings.connect(
+            "changed::render-cache-size",
+            lambda *args: self.render_cache.set_max_size(
+                self.__get_render_cache_size()
+            ),
+        )
+        settings.connect(
+            "changed::disk-cache-size",
+            lambda *args: self.disk_cache
+            and self.disk_cache.set_max_size(self.__get_disk_cache_size()),
+        )
+        settings.connect("changed::max-decode-memory", self.__set_memory_budget)
+        self.__set_memory_budget()
+
+    def prewarm(self):
+        """Import the conversion pipeline, if nothing needed it earlier.
+
+        Must run on the main thread, as lazy modules aren't thread-safe.
+        """
+        if self.disk_cache is None:
+            lazy_import.resolve(
+                animation, export, image_loader, renderer, texture_to_file
+            )
+            self.disk_cache = disk_cache.DiskCache(
+                disk_cache.default_directory(), self.__get_disk_cache_size()
+            )
+
+    def get_max_memory(self):
+        return self.__settings["max-decode-memory"] * 1024 * 1024
+
+    def __set_memory_budget(self, *args):
+        memory_budget.get_default().set_size(self.get_max_memory())
+
+    def __get_render_cache_size(self):
+        return self.__settings["render-cache-size"] * 1024 * 1024
+
+    def __get_disk_cache_size(self):
+        return self.__settings["disk-cache-size"] * 1024 * 1024
@@ -17,12 +17,28 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from gi.repository import Gio
+from gi.repository import Gdk, Gio
+from PIL import Image
+
+from . import tracing
+
+
+def to_image(texture):
+    """Copy the pixels of a Gdk.Texture into a PIL image."""
+    with tracing.span("texture_download"):
+        downloader = Gdk.TextureDownloader.new(texture)
+        downloader.set_format(Gdk.MemoryFormat.R8G8B8A8)
+        pixels, stride = downloader.download_bytes()
+
+    size = (texture.get_width(), texture.get_height())
+    return Image.frombuffer("RGBA", size, pixels.get_data(), "raw", "RGBA", stride, 1)
 
 
 def to_file(texture):
+    """Save a Gdk.Texture to a temporary PNG file, for GTK versions before 4.10."""
     save_file = Gio.File.new_tmp()[0]
     save_path = save_file.get_path()
-    texture.save_to_png(save_path)
+    with tracing.span("temp_file"):
+        texture.save_to_png(save_path)
 
     return save_file
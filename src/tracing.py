@@ -0,0 +1,194 @@
+# tracing.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import atexit
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Set to a file path to write spans to, or to "-" for standard error.
+# Paths ending in ".json" get a Chrome trace, anything else JSON lines.
+ENVIRONMENT_VARIABLE = "LETTERPRESS_TRACE"
+
+# Spans kept in memory for the debug overlay
+HISTORY = 512
+
+_lock = threading.Lock()
+_history = deque(maxlen=HISTORY)
+_writer = None
+_enabled = False
+
+
+class Span:
+    """Time an operation, as a context manager or until `end` is called."""
+
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = time.perf_counter_ns()
+
+    def end(self):
+        _record(self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **args):
+    """Start timing the operation `name`.
+
+    Costs next to nothing while tracing is disabled.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, args)
+
+
+def enable(path=None):
+    """Record spans from now on, also writing them to `path` if given."""
+    global _enabled, _writer
+
+    with _lock:
+        _enabled = True
+        if path is None or _writer is not None:
+            return
+
+        if path == "-":
+            _writer = _JsonLinesWriter(sys.stderr)
+        elif path.endswith(".json"):
+            _writer = _ChromeTraceWriter(path)
+        else:
+            _writer = _JsonLinesWriter(open(path, "a", buffering=1, encoding="utf-8"))
+
+
+def is_enabled():
+    return _enabled
+
+
+def recent(count):
+    """Return the names and durations in seconds of the last `count` spans."""
+    with _lock:
+        spans = list(_history)[-count:]
+    return [(name, duration / 1e9) for name, duration in reversed(spans)]
+
+
+def summary():
+    """Return the count, p50 and p95 in seconds of every recent span name."""
+    durations = {}
+    with _lock:
+        for name, duration in _history:
+            durations.setdefault(name, []).append(duration)
+
+    rows = []
+    for name, values in sorted(durations.items()):
+        values.sort()
+        rows.append(
+            (
+                name,
+                len(values),
+                _percentile(values, 0.5) / 1e9,
+                _percentile(values, 0.95) / 1e9,
+            )
+        )
+    return rows
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[round(fraction * (len(sorted_values) - 1))]
+
+
+def _record(name, start, duration, args):
+    with _lock:
+        _history.append((name, duration))
+        if _writer is not None:
+            _writer.write(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start / 1000,
+                    "dur": duration / 1000,
+                    "pid": os.getpid(),
+                    "tid": threading.get_native_id(),
+                    "args": args,
+                }
+            )
+
+
+class _JsonLinesWriter:
+    def __init__(self, stream):
+        self.__stream = stream
+
+    def write(self, event):
+        self.__stream.write(json.dumps(event, default=str) + "\n")
+
+
+class _ChromeTraceWriter:
+    """Collect events, writing them to a file loadable in about:tracing on exit."""
+
+    def __init__(self, path):
+        self.__path = path
+        self.__events = []
+        atexit.register(self.__flush)
+
+    def write(self, event):
+        self.__events.append(event)
+
+    def __flush(self):
+        with open(self.__path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": self.__events}, file, default=str)
+
+
+def _enable_from_environment():
+    path = os.environ.get(ENVIRONMENT_VARIABLE)
+    if not path:
+        return
+
+    # Worker processes never run exit handlers, so they can't write a
+    # Chrome trace; their spans still go to JSON lines
+    if path.endswith(".json") and multiprocessing.parent_process() is not None:
+        return
+    enable(path)
+
+
+_enable_from_environment()
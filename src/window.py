@@ -17,14 +17,26 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import subprocess
-from tempfile import NamedTemporaryFile
+import os
+import threading
 
-from gi.repository import Adw, Gdk, Gio, Gtk
-from PIL import Image, ImageChops, ImageOps
+from gi.repository import Adw, Gdk, Gio, GLib, Gtk
 
-from . import texture_to_file, supported_formats
-from .file_chooser import FileChooser
+from . import image_identity, lazy_import, process_pool, tracing
+from .conversion_worker import ConversionWorker
+from .output_view import OutputView  # Registers the type used in window.ui
+
+# Changes to the watched file are coalesced for this long, in milliseconds
+RELOAD_DELAY = 300
+
+# NumPy and Pillow are only imported once the welcome page is shown
+animation = lazy_import.module(".animation", __package__)
+image_loader = lazy_import.module(".image_loader", __package__)
+renderer = lazy_import.module(".renderer", __package__)
+texture_to_file = lazy_import.module(".texture_to_file", __package__)
+
+# Recent operations listed in the debug overlay
+TRACE_OVERLAY_OPERATIONS = 10
 
 
 @Gtk.Template(resource_path="/io/gitlab/gregorni/Letterpress/gtk/window.ui")
@@ -36,9 +48,16 @@ class LetterpressWindow(Adw.ApplicationWindow):
     toast_overlay = Gtk.Template.Child()
     main_stack = Gtk.Template.Child()
     output_scrolled_window = Gtk.Template.Child()
-    output_label = Gtk.Template.Child()
+    output_view = Gtk.Template.Child()
     width_spin = Gtk.Template.Child()
+    color_button = Gtk.Template.Child()
     toolbox = Gtk.Template.Child()
+    gallery_button = Gtk.Template.Child()
+    gallery_split_view = Gtk.Template.Child()
+    gallery_progress = Gtk.Template.Child()
+    gallery_list = Gtk.Template.Child()
+    trace_revealer = Gtk.Template.Child()
+    trace_label = Gtk.Template.Child()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -51,7 +70,7 @@ class LetterpressWindow(Adw.ApplicationWindow):
             actions=Gdk.DragAction.COPY,
         )
 
-        target.set_gtypes([Gdk.Texture, Gio.File])
+        target.set_gtypes([Gdk.FileList, Gdk.Texture, Gio.File])
         target.connect("drop", self.__on_drop)
         target.connect("enter", self.__on_enter)
         target.connect(
@@ -60,6 +79,7 @@ class LetterpressWindow(Adw.ApplicationWindow):
         self.add_controller(target)
 
         settings = Gio.Settings(schema_id="io.gitlab.gregorni.Letterpress")
+        self.settings = settings
         bind_flags = Gio.SettingsBindFlags.DEFAULT
         settings.bind("window-width", self, "default-width", bind_flags)
         settings.bind("window-height", self, "default-height", bind_flags)
@@ -72,93 +92,719 @@ class LetterpressWindow(Adw.ApplicationWindow):
 
         self.width_spin.connect("value-changed", self.__on_spin_value_changed)
 
+        settings.bind("color-output", self.color_button, "active", bind_flags)
+        settings.connect("changed::color-output", self.__set_color_scheme)
+
         self.previous_stack = "welcome"
         self.filepath = None
+        self.image = None
+        self.identity = None
+        self.rendering = None
+        self.animation = None
+        # The output of the image itself, rather than of an animation frame
+        self.__still_rendering = None
+        # Whether the opened file has frames to play
+        self.__animated = False
+
+        # Width changes wait for the image being opened, rather than cancel it
+        self.__loading = False
+
+        # Threads and caches are shared with the other windows
+        self.shared_state = self.get_application().shared_state
+        self.render_cache = self.shared_state.render_cache
+        self.worker = ConversionWorker(self.shared_state.scheduler, self)
+        # Reloading the watched file never cancels what the user waits for
+        self.__reload_worker = ConversionWorker(self.shared_state.scheduler, self)
+        self.connect("notify::is-active", self.__on_active_changed)
+        self.connect("close-request", self.__on_close_request)
+
+        self.__animation_cancellable = None
+        self.__frame_index = 0
+        self.__frame_timeout = None
+        self.__trace_timeout = None
+        self.__file_monitor = None
+        self.__reload_timeout = None
+
+        self.gallery = None
+
+        settings.connect("changed::watch-file", lambda *args: self.__watch())
+
+        GLib.idle_add(self.__prewarm, priority=GLib.PRIORITY_LOW)
+
+    def __prewarm(self):
+        """Import the conversion pipeline, if no image needed it earlier."""
+        self.shared_state.prewarm()
+        return GLib.SOURCE_REMOVE
+
+    def __on_active_changed(self, *args):
+        # The focused window's conversions run before the others'
+        if self.is_active():
+            self.shared_state.scheduler.set_foreground(self)
+
+    def __on_close_request(self, *args):
+        """Stop everything still running for this window."""
+        self.worker.cancel()
+        self.worker.cancel_prefetches()
+        self.__reload_worker.cancel()
+        self.shared_state.scheduler.forget(self)
+        self.__stop_animation()
+        self.filepath = None
+        self.__watch()
+        if self.__trace_timeout is not None:
+            GLib.source_remove(self.__trace_timeout)
+            self.__trace_timeout = None
+        return False
 
     def on_open_file(self):
+        from .file_chooser import FileChooser
+
         self.main_stack.set_visible_child_name("spinner-page")
         FileChooser.open_file(self, self.previous_stack)
 
-    def check_is_image(self, file):
+    def check_is_image(self, file, temporary=False):
+        """Open the image `file`, deleting it afterwards if it is `temporary`."""
+        self.__prewarm()
         filepath = file.get_path()
 
-        def __wrong_image_type():
-            print(f"{filepath} is not of a supported image type.")
-            # Translators: Do not translate "{basename}"
-            toast_text = _("“{basename}” is not of a supported image type.").format(
-                basename=file.get_basename()
-            )
+        width = self.__get_render_options()[0]
+
+        def __on_loaded(result):
+            self.__on_image_loaded(None if temporary else filepath, width, result)
+
+        def __on_error(error):
+            self.__loading = False
+            if isinstance(error, image_loader.ImageTooLargeError):
+                print(f"{filepath} is too large: {error}")
+                # Translators: Do not translate "{basename}"
+                toast_text = _("“{basename}” is too large to open")
+            elif isinstance(error, IOError):
+                print(f"{filepath} is not of a supported image type.")
+                # Translators: Do not translate "{basename}"
+                toast_text = _("“{basename}” is not of a supported image type.")
+            else:
+                print(f"Unable to open {filepath}: {error}")
+                # Translators: Do not translate "{basename}"
+                toast_text = _("“{basename}” could not be opened")
+
+            toast_text = toast_text.format(basename=file.get_basename())
             self.toast_overlay.add_toast(Adw.Toast.new(toast_text))
             self.main_stack.set_visible_child_name(self.previous_stack)
 
-        try:
-            with Image.open(filepath) as img:
-                if self.filepath and file:
-                    with Image.open(self.filepath) as old_img:
-                        same_image = not ImageChops.difference(
-                            old_img.convert("RGB"), img.convert("RGB")
-                        ).getbbox()
-                        if same_image:
-                            self.main_stack.set_visible_child_name(self.previous_stack)
-                            return
-
-                self.main_stack.set_visible_child_name("spinner-page")
-                print(f"Input file: {filepath}")
-
-                img_format = img.format
-                uppercase_formats = list(
-                    map(lambda x: x.upper(), supported_formats.formats)
-                )
-                if img_format not in uppercase_formats:
-                    __wrong_image_type()
-                    return
+        self.main_stack.set_visible_child_name("spinner-page")
+        self.__loading = True
+        self.worker.submit(
+            self.__load_image,
+            __on_loaded,
+            __on_error,
+            filepath,
+            temporary,
+            self.identity,
+            self.shared_state.disk_cache,
+            self.shared_state.get_max_memory(),
+            *self.__get_render_options(),
+        )
+
+    def open_files(self, files):
+        """Open a single image, or queue several in the gallery."""
+        if len(files) == 1:
+            self.check_is_image(files[0])
+            return
+
+        if self.gallery is None:
+            from .gallery import Gallery
+
+            self.__prewarm()
+            self.gallery = Gallery(
+                self.gallery_list,
+                self.gallery_progress,
+                self.__on_gallery_item_activated,
+                self.shared_state.scheduler,
+                self,
+            )
 
-                self.filepath = NamedTemporaryFile(suffix=f".{img_format}").name
+        width, backend = self.__get_render_options()
+        self.gallery.add_files(
+            files, width, backend, self.shared_state.get_max_memory()
+        )
+        self.gallery_button.set_visible(True)
+        self.gallery_split_view.set_show_sidebar(True)
 
-                shrunken_img = ImageOps.cover(img, (500, 500))
-                exif_rotated_img = ImageOps.exif_transpose(shrunken_img)
-                exif_rotated_img.save(self.filepath, format=img_format)
+    def load_texture(self, texture):
+        """Open a pasted or dropped texture, without going through a file."""
+        self.__prewarm()
+        try:
+            image = texture_to_file.to_image(texture)
+        except (AttributeError, GLib.GError) as error:
+            print(f"Unable to download texture, saving it instead: {error}")
+            self.check_is_image(texture_to_file.to_file(texture), temporary=True)
+            return
 
-                self.__convert_image(self.filepath)
-        except Image.DecompressionBombError:
-            print("Warning! Image is HUGE!!")
-            self.__convert_image(filepath)
-        except IOError:
-            __wrong_image_type()
+        width = self.__get_render_options()[0]
+
+        def __on_error(error):
+            self.__loading = False
+            print(f"Unable to open texture: {error}")
+            self.toast_overlay.add_toast(Adw.Toast.new(_("Image could not be opened")))
+            self.main_stack.set_visible_child_name(self.previous_stack)
 
-    def __convert_image(self, filepath):
         self.main_stack.set_visible_child_name("spinner-page")
+        self.__loading = True
+        self.worker.submit(
+            self.__load_texture_image,
+            lambda result: self.__on_image_loaded(None, width, result),
+            __on_error,
+            image,
+            self.identity,
+            *self.__get_render_options(),
+        )
+
+    @staticmethod
+    def __load_image(
+        cancellable,
+        filepath,
+        temporary,
+        previous_identity,
+        disk_cache,
+        max_memory,
+        width,
+        backend,
+    ):
+        """Preprocess and convert the image at `filepath`.
+
+        Runs on the worker thread, so it must not touch any widgets.
+        Returns None if the image is the one currently shown. The image
+        is not decoded at all if its rendering is in the disk cache,
+        unless the file is about to be deleted. Temporary files are
+        never animated, since their frames couldn't be decoded later.
+        """
+        try:
+            identity = image_identity.ImageIdentity(
+                image_identity.file_digest(filepath)
+            )
+            if identity == previous_identity:
+                return None
+
+            cancellable.set_error_if_cancelled()
+            print(f"Input file: {filepath}")
+
+            key = (identity.digest, width, backend)
+            rendering = disk_cache.get(key)
+            image = None
+            if rendering is None or temporary:
+                image = image_loader.load(filepath, max_memory, width)
+            animated = not temporary and animation.is_animated(filepath)
+        finally:
+            if temporary:
+                os.remove(filepath)
+
+        if image is not None:
+            identity.perceptual_hash = image_identity.perceptual_hash(image)
+
+        if rendering is None:
+            cancellable.set_error_if_cancelled()
+            rendering = renderer.convert(image, width, backend)
+            disk_cache.put(key, rendering)
+        return image, identity, rendering, animated
+
+    @staticmethod
+    def __render(cancellable, image, filepath, key, disk_cache, max_memory, on_band):
+        """Convert an image, decoding it first if that was skipped.
+
+        The image is decoded again if it lacks the detail `key` needs.
+        Large grids are rendered in bands on the process pool, each band
+        being passed to `on_band` on the main loop as soon as it is done.
+        Runs on the worker thread, so it must not touch any widgets.
+        """
+        rendering = disk_cache.get(key)
+        if rendering is not None:
+            return image, rendering
+
+        _digest, width, backend = key
+        if image is None or (
+            filepath is not None and not image_loader.has_detail_for(image, width)
+        ):
+            image = image_loader.load(filepath, max_memory, width)
+            cancellable.set_error_if_cancelled()
+
+        if backend == "builtin" and renderer.is_large(image.size, width):
+            rows = renderer.grid_size(image.size, width)[1]
+            bands = []
+            for band in renderer.render_bands(image, width, process_pool.get_default()):
+                cancellable.set_error_if_cancelled()
+                bands.append(band)
+                GLib.idle_add(on_band, cancellable, rows, *band)
+            rendering = renderer.stitch(bands)
+        else:
+            rendering = renderer.convert(image, width, backend)
+
+        disk_cache.put(key, rendering)
+        return image, rendering
+
+    @staticmethod
+    def __load_texture_image(cancellable, image, previous_identity, width, backend):
+        """Preprocess and convert a downloaded texture.
+
+        Runs on the worker thread, so it must not touch any widgets.
+        Returns None if the image is the one currently shown.
+        """
+        identity = image_identity.ImageIdentity(
+            image_identity.bytes_digest(image.tobytes())
+        )
+        if identity == previous_identity:
+            return None
+
+        image = image_loader.prepare(image, width)
+        identity.perceptual_hash = image_identity.perceptual_hash(image)
+
+        cancellable.set_error_if_cancelled()
+        return image, identity, renderer.convert(image, width, backend), False
+
+    def __on_image_loaded(self, filepath, width, result):
+        """Show an image loaded at `width`, converting it again if that changed."""
+        self.__loading = False
+        if result is None:
+            self.main_stack.set_visible_child_name(self.previous_stack)
+            return
+
+        self.filepath = filepath
+        self.image, self.identity, rendering, self.__animated = result
+        self.render_cache.put(self.__get_cache_key(width), rendering)
+        self.__show_output(rendering)
+        self.__watch()
+
+        if width != self.__get_render_options()[0]:
+            self.__convert_image(progressive=True)
+
+    def __watch(self):
+        """Watch the opened file for changes, if enabled."""
+        if self.__file_monitor is not None:
+            self.__file_monitor.cancel()
+            self.__file_monitor = None
+        if self.__reload_timeout is not None:
+            GLib.source_remove(self.__reload_timeout)
+            self.__reload_timeout = None
+        self.__reload_worker.cancel()
+
+        if self.filepath is None or not self.settings["watch-file"]:
+            return
+
+        # Editors often save by moving a new file over the old one
+        self.__file_monitor = Gio.File.new_for_path(self.filepath).monitor_file(
+            Gio.FileMonitorFlags.WATCH_MOVES, None
+        )
+        self.__file_monitor.connect("changed", self.__on_file_changed)
+
+    def __on_file_changed(self, monitor, file, other_file, event_type):
+        if event_type in (
+            Gio.FileMonitorEvent.ATTRIBUTE_CHANGED,
+            Gio.FileMonitorEvent.DELETED,
+            Gio.FileMonitorEvent.MOVED_OUT,
+            Gio.FileMonitorEvent.PRE_UNMOUNT,
+            Gio.FileMonitorEvent.UNMOUNTED,
+        ):
+            return
+
+        # Saving emits a burst of events, only reload after the last one
+        if self.__reload_timeout is not None:
+            GLib.source_remove(self.__reload_timeout)
+        self.__reload_timeout = GLib.timeout_add(RELOAD_DELAY, self.__reload)
+
+    def __reload(self):
+        if self.worker.is_busy():
+            # Wait for the job the user is waiting for, rather than racing it
+            return GLib.SOURCE_CONTINUE
+
+        self.__reload_timeout = None
+        filepath = self.filepath
+        options = self.__get_render_options()
+        self.__reload_worker.submit(
+            self.__reload_image,
+            lambda result: self.__on_image_reloaded(filepath, options, result),
+            lambda error: print(f"Unable to reload {filepath}: {error}"),
+            filepath,
+            self.identity,
+            self.image,
+            self.__still_rendering,
+            self.shared_state.disk_cache,
+            self.shared_state.get_max_memory(),
+            *options,
+        )
+        return GLib.SOURCE_REMOVE
+
+    @staticmethod
+    def __reload_image(
+        cancellable,
+        filepath,
+        previous_identity,
+        previous_image,
+        previous_rendering,
+        disk_cache,
+        max_memory,
+        width,
+        backend,
+    ):
+        """Convert the changed file at `filepath`, redoing changed rows only.
+
+        Runs on the worker thread, so it must not touch any widgets.
+        Returns None if the file's contents didn't change. Otherwise
+        returns the rows that changed too, or None if every row did.
+        """
+        identity = image_identity.ImageIdentity(image_identity.file_digest(filepath))
+        if identity == previous_identity:
+            return None
+
+        image = image_loader.load(filepath, max_memory, width)
+        identity.perceptual_hash = image_identity.perceptual_hash(image)
+        animated = animation.is_animated(filepath)
+        cancellable.set_error_if_cancelled()
+
+        if backend == "builtin" and previous_image is not None:
+            rendering, changed = renderer.rerender(
+                previous_rendering, previous_image, image, width
+            )
+            if rendering.levels.shape != previous_rendering.levels.shape:
+                changed = None
+        else:
+            rendering = renderer.convert(image, width, backend)
+            changed = renderer.changed_rows(previous_rendering, rendering)
 
-        arguments = ["artem", f"--size={int(self.width_spin.get_value())}", filepath]
-        if not self.style_manager.get_dark():
-            arguments.append("--invert")
+        disk_cache.put((identity.digest, width, backend), rendering)
+        return image, identity, rendering, changed, animated
 
-        output = subprocess.Popen(
-            arguments,
-            stdout=subprocess.PIPE,
-            universal_newlines=True,
-        ).stdout.readline
+    def __on_image_reloaded(self, filepath, options, result):
+        if result is None or filepath != self.filepath or self.__loading:
+            return
+
+        self.image, self.identity, rendering, changed, self.__animated = result
+        self.render_cache.put((self.identity.digest, *options), rendering)
+        if options != self.__get_render_options() or self.worker.is_busy():
+            # The user asked for other options since, convert for those
+            self.__convert_image(progressive=True)
+            return
+        if changed is None or self.animation is not None:
+            self.__show_output(rendering)
+            return
+
+        self.rendering = self.__still_rendering = rendering
+        if len(changed) > 0:
+            rows = renderer.Rendering(
+                rendering.levels[changed],
+                None if rendering.colors is None else rendering.colors[changed],
+            )
+            self.output_view.replace_rows(
+                changed, rows.to_rows(self.get_invert()), self.__get_colors(rows)
+            )
+        # Frames still being converted come from the old contents
+        self.__start_animation()
+
+    def get_output_text(self):
+        """Return the current output in the current color scheme."""
+        return self.rendering.to_text(self.get_invert())
+
+    def get_invert(self):
+        """Whether dark areas get dense glyphs, for dark text on a light background."""
+        return not self.style_manager.get_dark()
+
+    def __get_render_options(self):
+        return int(self.width_spin.get_value()), self.settings["conversion-backend"]
+
+    def __get_cache_key(self, width=None):
+        if width is None:
+            width = int(self.width_spin.get_value())
+        return self.identity.digest, width, self.settings["conversion-backend"]
+
+    def __convert_image(self, progressive=False):
+        """Show the image at the current width, converting it if needed.
+
+        If `progressive`, an approximation is shown right away instead of
+        the spinner, and the conversion waits for the width to settle.
+        """
+        cache_key = self.__get_cache_key()
+        rendering = self.render_cache.get(cache_key)
+        if rendering is not None:
+            self.worker.cancel()
+            self.__show_output(rendering)
+            return
+
+        def __on_converted(result):
+            image, rendering = result
+            if image is not None:
+                self.image = image
+            self.render_cache.put(cache_key, rendering)
+            self.__show_output(rendering)
+
+        submit = self.worker.submit
+        if progressive and self.rendering is not None:
+            self.__show_preview(cache_key[1])
+            submit = self.worker.submit_later
+        else:
+            self.main_stack.set_visible_child_name("spinner-page")
+
+        submit(
+            self.__render,
+            __on_converted,
+            self.__on_conversion_error,
+            self.image,
+            self.filepath,
+            cache_key,
+            self.shared_state.disk_cache,
+            self.shared_state.get_max_memory(),
+            self.__on_band_rendered,
+        )
 
-        joint_output = "".join(line for line in iter(output, ""))
-        self.output_label.set_label(joint_output)
+    def __on_band_rendered(self, cancellable, rows, first, last, band):
+        """Show the rows of a large conversion that are already done."""
+        if cancellable.is_cancelled():
+            return GLib.SOURCE_REMOVE
+
+        if first == 0:
+            self.__stop_animation()
+            self.output_view.set_rows(
+                [""] * rows,
+                self.__get_colors(renderer.Rendering.empty(rows, band.columns)),
+            )
+            self.main_stack.set_visible_child_name("view-page")
+
+        self.output_view.replace_rows(
+            range(first, last), band.to_rows(self.get_invert()), self.__get_colors(band)
+        )
+        return GLib.SOURCE_REMOVE
+
+    def __show_preview(self, width):
+        """Show the current output rescaled to `width`, until it is converted."""
+        self.__stop_animation()
+        preview = renderer.rescale(self.rendering, width)
+        self.output_view.set_rows(
+            preview.to_rows(self.get_invert()), self.__get_colors(preview)
+        )
+        self.output_view.add_css_class("preview")
+
+    def __show_output(self, rendering):
+        self.rendering = self.__still_rendering = rendering
+        self.output_view.remove_css_class("preview")
+        self.__update_output_view()
+        self.__start_animation()
 
         self.toolbox.set_reveal_child(True)
         self.previous_stack = "view-page"
         self.main_stack.set_visible_child_name(self.previous_stack)
 
+        GLib.idle_add(self.__prefetch, priority=GLib.PRIORITY_LOW)
+
+    def __prefetch(self):
+        """Render the widths the user is likely to pick next."""
+        power_saver = Gio.PowerProfileMonitor.dup_default().get_power_saver_enabled()
+        if not self.settings["prefetch-renders"] or power_saver:
+            return GLib.SOURCE_REMOVE
+
+        # Images shown from the disk cache are only decoded when needed
+        if self.image is None:
+            return GLib.SOURCE_REMOVE
+
+        width, backend = self.__get_render_options()
+        step = int(self.width_spin.get_adjustment().get_step_increment())
+        lower, upper = self.width_spin.get_range()
+
+        for candidate_width in (width + step, width - step):
+            key = self.__get_cache_key(candidate_width)
+            if not lower <= candidate_width <= upper or key in self.render_cache:
+                continue
+            # Wider outputs may need the image decoded again
+            if not image_loader.has_detail_for(self.image, candidate_width):
+                continue
+
+            self.worker.prefetch(
+                lambda cancellable, *args: renderer.convert(*args),
+                lambda rendering, key=key: self.render_cache.put(key, rendering),
+                self.image,
+                candidate_width,
+                backend,
+            )
+        return GLib.SOURCE_REMOVE
+
+    def __start_animation(self):
+        """Convert the frames of the current image, if it is animated."""
+        self.__stop_animation()
+        if self.filepath is None or not self.__animated:
+            return
+
+        self.__animation_cancellable = Gio.Cancellable()
+        threading.Thread(
+            target=self.__convert_animation,
+            args=(
+                self.__animation_cancellable,
+                animation.Animation(),
+                self.filepath,
+                *self.__get_render_options(),
+                self.shared_state.get_max_memory(),
+            ),
+            daemon=True,
+        ).start()
+
+    def __stop_animation(self):
+        if self.__animation_cancellable is not None:
+            self.__animation_cancellable.cancel()
+            self.__animation_cancellable = None
+        if self.__frame_timeout is not None:
+            GLib.source_remove(self.__frame_timeout)
+            self.__frame_timeout = None
+        self.animation = None
+
+    def __convert_animation(
+        self, cancellable, frames, filepath, width, backend, max_memory
+    ):
+        """Feed converted frames to the main loop, on a thread of its own."""
+        try:
+            for rendering, duration in animation.convert_frames(
+                filepath,
+                width,
+                backend,
+                process_pool.get_default(),
+                max_memory,
+                cancellable,
+            ):
+                GLib.idle_add(
+                    self.__on_frame_converted, cancellable, frames, rendering, duration
+                )
+            GLib.idle_add(self.__on_frame_converted, cancellable, frames, None, None)
+        except Exception as error:
+            print(f"Unable to convert the frames of {filepath}: {error}")
+
+    def __on_frame_converted(self, cancellable, frames, rendering, duration):
+        if cancellable.is_cancelled():
+            return GLib.SOURCE_REMOVE
+
+        if rendering is None:
+            frames.finished = True
+        elif not frames.append(rendering, duration):
+            print(f"Only playing the first {len(frames)} frames, to save memory")
+            # Stop converting the frames that wouldn't fit either
+            cancellable.cancel()
+
+        # Start playing once the second frame is ready, from the first frame
+        # as converted here, which later frames only store the changes to.
+        # The still image shown until now may be prepared differently.
+        if self.animation is None and len(frames) > 1:
+            self.animation = frames
+            self.__frame_index = -1
+            self.__show_next_frame()
+        return GLib.SOURCE_REMOVE
+
+    def __show_next_frame(self):
+        frames = self.animation
+        index = self.__frame_index + 1
+        if index >= len(frames):
+            # Wait for the frame to be converted, unless the animation is over
+            index = 0 if frames.finished else self.__frame_index
+        if index == self.__frame_index:
+            self.__frame_timeout = GLib.timeout_add(
+                animation.DEFAULT_DURATION, self.__show_next_frame
+            )
+            return GLib.SOURCE_REMOVE
+
+        changed, rows, duration = frames.changes(index)
+        if index == 0:
+            self.rendering = renderer.Rendering(rows.levels.copy(), rows.colors)
+            self.__update_output_view()
+        else:
+            # The current frame's grid is patched in place, so it must not
+            # be shared with the render cache
+            if self.__frame_index == 0:
+                self.rendering = renderer.Rendering(
+                    self.rendering.levels.copy(),
+                    (
+                        None
+                        if self.rendering.colors is None
+                        else self.rendering.colors.copy()
+                    ),
+                )
+            self.rendering.levels[changed] = rows.levels
+            if self.rendering.colors is not None and rows.colors is not None:
+                self.rendering.colors[changed] = rows.colors
+            self.output_view.replace_rows(
+                changed, rows.to_rows(self.get_invert()), self.__get_colors(rows)
+            )
+
+        self.__frame_index = index
+        self.__frame_timeout = GLib.timeout_add(duration, self.__show_next_frame)
+        return GLib.SOURCE_REMOVE
+
+    def toggle_trace_overlay(self):
+        """Show or hide the timings of recent operations."""
+        if self.__trace_timeout is not None:
+            GLib.source_remove(self.__trace_timeout)
+            self.__trace_timeout = None
+            self.trace_revealer.set_reveal_child(False)
+            return
+
+        self.__update_trace_overlay()
+        self.__trace_timeout = GLib.timeout_add(500, self.__update_trace_overlay)
+        self.trace_revealer.set_reveal_child(True)
+
+    def __update_trace_overlay(self):
+        lines = [f"{'span':<16} {'n':>4} {'p50 ms':>9} {'p95 ms':>9}"]
+        lines.extend(
+            f"{name:<16} {count:>4} {p50 * 1000:>9.2f} {p95 * 1000:>9.2f}"
+            for name, count, p50, p95 in tracing.summary()
+        )
+        lines.append("")
+        lines.extend(
+            f"{name:<16} {duration * 1000:>20.2f}"
+            for name, duration in tracing.recent(TRACE_OVERLAY_OPERATIONS)
+        )
+        lines.append("")
+        lines.append(f"render cache: {self.render_cache}")
+        self.trace_label.set_label("\n".join(lines))
+        return GLib.SOURCE_CONTINUE
+
+    def __on_gallery_item_activated(self, item):
+        self.__loading = False
+        self.filepath = item.file.get_path()
+        # Decoded again by __render if a different output needs it
+        self.image, self.identity = None, item.identity
+        self.__animated = item.animated
+        self.render_cache.put(self.__get_cache_key(item.width), item.rendering)
+        self.__convert_image()
+        self.__watch()
+
+    def __on_conversion_error(self, error):
+        print(f"Unable to convert image: {error}")
+        self.main_stack.set_visible_child_name(self.previous_stack)
+        if self.rendering is not None:
+            # Replace any preview with the last exact output
+            self.output_view.remove_css_class("preview")
+            self.__update_output_view()
+
     def __set_color_scheme(self, *args):
-        if self.filepath != None:
-            self.__convert_image(self.filepath)
+        # Only the mapping from levels to glyphs depends on the color scheme
+        if self.rendering is not None:
+            self.__update_output_view()
+
+    def __update_output_view(self):
+        self.output_view.set_rows(
+            self.rendering.to_rows(self.get_invert()),
+            self.__get_colors(self.rendering),
+        )
+
+    def __get_colors(self, rendering):
+        """Return the palette colors to show `rendering` in, if any."""
+        if not self.settings["color-output"] or rendering.colors is None:
+            return None
+        return renderer.quantize_colors(rendering.colors)
 
     def __on_spin_value_changed(self, spin_button):
-        self.main_stack.set_visible_child_name("spinner-page")
-        self.__convert_image(self.filepath)
+        if self.identity is not None and not self.__loading:
+            self.__convert_image(progressive=True)
 
     def __on_enter(self, *args):
         self.drag_revealer.set_reveal_child(True)
         return Gdk.DragAction.COPY
 
     def __on_drop(self, widget, drop, *args):
+        if isinstance(drop, Gdk.FileList):
+            self.open_files(drop.get_files())
+            return
+
         failed_as_file = False
         try:
             self.check_is_image(drop)
@@ -169,8 +815,7 @@ class LetterpressWindow(Adw.ApplicationWindow):
             return
 
         try:
-            file = texture_to_file.to_file(drop)
-            self.check_is_image(file)
+            self.load_texture(drop)
         except:
             toast = Adw.Toast.new(_("Dropped item is not a valid image"))
             self.toast_overlay.add_toast(toast)
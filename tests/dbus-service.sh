@@ -0,0 +1,86 @@
+#!/bin/sh
+
+# dbus-service.sh
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Convert an image through the D-Bus service of an installed Letterpress,
+# on a private session bus.
+#
+# Usage: tests/dbus-service.sh [IMAGE]
+
+set -eu
+
+LETTERPRESS=${LETTERPRESS:-letterpress}
+APP_ID=${APP_ID:-io.gitlab.gregorni.Letterpress}
+
+if [ -z "${LETTERPRESS_PRIVATE_BUS:-}" ]; then
+    LETTERPRESS_PRIVATE_BUS=1 exec dbus-run-session -- "$0" "$@"
+fi
+
+image=$(realpath "${1:-$(dirname "$0")/../data/screenshots/copied.png}")
+object_path="/$(echo "$APP_ID" | tr . /)/Converter"
+method=io.gitlab.gregorni.Letterpress.Converter.Convert
+errors=$(mktemp)
+
+"$LETTERPRESS" --gapplication-service &
+service=$!
+trap 'kill "$service" 2>/dev/null; rm -f "$errors"' EXIT
+
+gdbus wait --session --timeout 10 "$APP_ID"
+
+call() {
+    gdbus call --session --dest "$APP_ID" --object-path "$object_path" \
+        --method "$method" "$@"
+}
+
+output=$(call "$image" 40 false)
+case "$output" in
+    "('"?*"',)")
+        echo "PASS: converted $image" ;;
+    *)
+        echo "FAIL: unexpected reply to Convert: $output"
+        exit 1 ;;
+esac
+
+if call "$(basename "$image")" 40 false 2>"$errors" >/dev/null; then
+    echo "FAIL: a relative path was accepted"
+    exit 1
+fi
+if ! grep -q InvalidArgs "$errors"; then
+    echo "FAIL: unexpected error for a relative path: $(cat "$errors")"
+    exit 1
+fi
+echo "PASS: rejected a relative path"
+
+if call "$image" 0 false 2>"$errors" >/dev/null; then
+    echo "FAIL: a width of 0 was accepted"
+    exit 1
+fi
+echo "PASS: rejected a width of 0"
+
+# The widest output the width spin button offers
+if call "$image" 4001 false 2>"$errors" >/dev/null; then
+    echo "FAIL: a width of 4001 was accepted"
+    exit 1
+fi
+if ! grep -q InvalidArgs "$errors"; then
+    echo "FAIL: unexpected error for a width of 4001: $(cat "$errors")"
+    exit 1
+fi
+echo "PASS: rejected a width of 4001"
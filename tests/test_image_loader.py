@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# test_image_loader.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Check that decoding PNG images in strips matches a full decode."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from test_renderer import SOURCE_DIR, load_package
+
+load_package(SOURCE_DIR)
+from letterpress import image_loader  # noqa: E402
+
+
+def noise_png(directory, mode, size, seed=0):
+    """Save an image of random pixels in `mode` and return its path."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    img = Image.fromarray(rng.integers(0, 256, (height, width, 4), dtype=np.uint8))
+    if mode == "P":
+        img = img.convert("RGB").quantize(64)
+    else:
+        img = img.convert(mode)
+
+    path = os.path.join(directory, f"{mode}.png")
+    img.save(path, compress_level=1)
+    return path
+
+
+class DecodeStripsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        # Small enough that the images below are reduced, in several strips
+        patcher = mock.patch.object(image_loader, "PREVIEW_SIZE", (40, 40))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def full_decode(self, path, width):
+        with Image.open(path) as img:
+            img.load()
+            return image_loader._prepare(img, img.size, width)
+
+    def test_strips_match_full_decode(self):
+        for mode in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            path = noise_png(self.directory.name, mode, (331, 257))
+            expected = self.full_decode(path, 0)
+            # A strip of a few rows, rows not dividing the height, and one row
+            for strip_size in (4096, 1500, 1):
+                with self.subTest(mode=mode, strip_size=strip_size):
+                    with mock.patch.object(image_loader, "STRIP_SIZE", strip_size):
+                        img = image_loader.load(path)
+                    self.assertEqual(img.mode, expected.mode)
+                    self.assertEqual(img.size, expected.size)
+                    self.assertEqual(img.tobytes(), expected.tobytes())
+
+    def test_strips_are_used(self):
+        path = noise_png(self.directory.name, "RGB", (331, 257))
+        with mock.patch.object(image_loader, "STRIP_SIZE", 4096):
+            with mock.patch.object(
+                image_loader, "_decode_strips", wraps=image_loader._decode_strips
+            ) as decode_strips:
+                image_loader.load(path)
+        decode_strips.assert_called_once()
+        self.assertGreater(decode_strips.call_args.args[1], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# test_renderer.py
+#
+# Copyright 2024 Letterpress Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Check that parallel bands and partial rerenders match a plain render."""
+
+import importlib.util
+import os
+import sys
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+SOURCE_DIR = os.environ.get(
+    "LETTERPRESS_SOURCE_DIR", os.path.join(os.path.dirname(__file__), "..", "src")
+)
+
+
+def load_package(source_dir):
+    """Import the sources as the `letterpress` package, as installed."""
+    spec = importlib.util.spec_from_file_location(
+        "letterpress",
+        os.path.join(source_dir, "__init__.py"),
+        submodule_search_locations=[source_dir],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["letterpress"] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+load_package(SOURCE_DIR)
+from letterpress import renderer  # noqa: E402
+
+
+def noise_image(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+class RenderBandsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ProcessPoolExecutor(max_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def assert_identical(self, rendering, expected):
+        self.assertEqual(rendering.levels.tobytes(), expected.levels.tobytes())
+        self.assertEqual(rendering.colors.tobytes(), expected.colors.tobytes())
+        self.assertEqual(rendering.to_text(), expected.to_text())
+
+    def test_bands_match_render_levels(self):
+        # Cells both larger and smaller than a pixel, and uneven bands
+        for size, width, band_count in (
+            ((640, 480), 100, 7),
+            ((500, 500), 1700, 12),
+            ((333, 97), 50, 5),
+        ):
+            with self.subTest(size=size, width=width, band_count=band_count):
+                img = noise_image(*size)
+                bands = list(
+                    renderer.render_bands(img, width, self.executor, band_count)
+                )
+                self.assert_identical(
+                    renderer.stitch(bands), renderer.render_levels(img, width)
+                )
+
+    def test_bands_cover_every_row_in_order(self):
+        img = noise_image(300, 200)
+        rows = renderer.grid_size(img.size, 80)[1]
+        bands = list(renderer.render_bands(img, 80, self.executor, 6))
+        edges = [(first, last) for first, last, _rendering in bands]
+        self.assertEqual(edges[0][0], 0)
+        self.assertEqual(edges[-1][1], rows)
+        for (_first, last), (first, _last) in zip(edges, edges[1:]):
+            self.assertEqual(last, first)
+
+    def test_more_bands_than_rows(self):
+        img = noise_image(400, 20)
+        bands = list(renderer.render_bands(img, 10, self.executor, 64))
+        self.assert_identical(renderer.stitch(bands), renderer.render_levels(img, 10))
+
+    def test_convert_uses_bands_for_large_grids(self):
+        img = noise_image(500, 500)
+        self.assertTrue(renderer.is_large(img.size, 1600))
+        self.assert_identical(
+            renderer.convert(img, 1600, executor=self.executor),
+            renderer.render_levels(img, 1600),
+        )
+
+
+class RerenderTest(unittest.TestCase):
+    def assert_identical(self, rendering, expected):
+        self.assertEqual(rendering.levels.tobytes(), expected.levels.tobytes())
+        self.assertEqual(rendering.colors.tobytes(), expected.colors.tobytes())
+
+    def rerender(self, previous_img, img, width):
+        rendering, changed = renderer.rerender(
+            renderer.render_levels(previous_img, width), previous_img, img, width
+        )
+        self.assert_identical(rendering, renderer.render_levels(img, width))
+        return changed
+
+    def edited(self, img, *boxes):
+        """Return a copy of `img` with every (left, top, right, bottom) box edited."""
+        edited_img = img.copy()
+        for seed, box in enumerate(boxes, 1):
+            width, height = box[2] - box[0], box[3] - box[1]
+            edited_img.paste(noise_image(width, height, seed), box[:2])
+        return edited_img
+
+    def test_localized_edits(self):
+        # Cells both larger and smaller than a pixel, edits at the edges and
+        # apart from each other, and a single pixel
+        for size, width, boxes in (
+            ((640, 480), 100, [(10, 100, 60, 130)]),
+            ((640, 480), 100, [(0, 0, 640, 3), (300, 470, 320, 480)]),
+            ((333, 97), 50, [(5, 5, 6, 6), (200, 40, 210, 60), (0, 96, 1, 97)]),
+            ((50, 40), 300, [(20, 10, 21, 11)]),
+            ((50, 40), 300, [(0, 0, 50, 1), (10, 25, 30, 28), (49, 39, 50, 40)]),
+        ):
+            with self.subTest(size=size, width=width, boxes=boxes):
+                img = noise_image(*size)
+                edited_img = self.edited(img, *boxes)
+                changed = self.rerender(img, edited_img, width)
+
+                rows = renderer.grid_size(size, width)[1]
+                self.assertGreater(len(changed), 0)
+                self.assertLess(len(changed), rows)
+
+    def test_cells_smaller_than_a_pixel_redo_every_row_of_it(self):
+        img = noise_image(50, 40)
+        changed = self.rerender(img, self.edited(img, (7, 12, 8, 13)), 300)
+
+        # Every row within the edited pixel row, and no others
+        rows = renderer.grid_size(img.size, 300)[1]
+        edges = renderer._cell_edges(img.height, rows)
+        starts, stops = renderer._pixel_rows(edges)
+        expected = np.flatnonzero((starts <= 12) & (stops > 12))
+        self.assertGreater(len(expected), 1)
+        self.assertEqual(changed.tolist(), expected.tolist())
+
+    def test_unchanged_image_redoes_nothing(self):
+        img = noise_image(200, 150)
+        changed = self.rerender(img, img.copy(), 80)
+        self.assertEqual(len(changed), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()